@@ -1,11 +1,33 @@
 import streamlit as st
 import json
 import os
+import sys
 import pandas as pd
+import numpy as np
+import sqlite3
+import bisect
+import codecs
+import io
+import threading
 import time
 import uuid
+from array import array
+from collections import Counter
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, timedelta
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    import msvcrt
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # nur für Parquet-Import/-Export nötig
+    pa = pq = None
+
 # === 1. SEITEN-KONFIGURATION ===
 st.set_page_config(page_title="KVS Pro", layout="wide", page_icon="👥")
 
@@ -33,27 +55,290 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # === 3. DATENMODELLE & LOGIK ===
+# Datendatei: *.json -> JSON + Journal, *.db/*.sqlite -> SQLite
+DATEI = os.environ.get("KVS_DATEI", "kunden.json")
+TERMIN_DAUER = 30  # Minuten; Termine ohne Endzeit im Text dauern so lange
+DAUER_MIN, DAUER_MAX = 1, 1439  # Minuten; mehr unterscheidet die Endzeit im Text nicht, Termin.from_text liefert nur diese
+OEFFNUNGSZEITEN = (8, 18)  # volle Stunden Mo-Fr, in denen freie Slots gesucht werden
+PROFILING = os.environ.get("KVS_PROFILING", "") not in ("", "0")
+# Admin-Bereich der Sidebar: aus ohne KVS_ADMIN, "1" = für alle Sessions, sonst nur mit ?admin=<Wert> in der URL
+ADMIN = os.environ.get("KVS_ADMIN", "")
+
+def _intern(wert):
+    # Wiederkehrende Werte (Anrede, Geschlecht, Orte, Notizen) nur einmal im Speicher halten
+    return sys.intern(wert) if isinstance(wert, str) else wert
+
+class Messwerte:
+    """Opt-in-Messung der heißen Pfade: Spans (Anzahl, Summe, Maximum je Name) und Zähler.
+
+    Eingeschaltet über KVS_PROFILING=1 oder den Schalter im Admin-Bereich der Sidebar; ausgeschaltet
+    kostet messen() nur eine Attributabfrage. Spans zählen außerdem zum laufenden Skriptdurchlauf
+    des eigenen Threads (Zeitleiste im Admin-Bereich), mit KVS_PROFILING_LOG=datei wird jeder
+    Durchlauf als JSON-Zeile angehängt.
+    """
+    def __init__(self):
+        self.aktiv = PROFILING
+        self.log = os.environ.get("KVS_PROFILING_LOG")
+        self.sperre = threading.Lock()
+        self._lokal = threading.local()
+        self.zuruecksetzen()
+
+    def zuruecksetzen(self):
+        with self.sperre:
+            self.spans = {}  # Name -> [Anzahl, Summe s, Maximum s]
+            self.zaehler = Counter()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            dauer = time.perf_counter() - start
+            with self.sperre:
+                werte = self.spans.setdefault(name, [0, 0.0, 0.0])
+                werte[0] += 1; werte[1] += dauer; werte[2] = max(werte[2], dauer)
+            lauf = getattr(self._lokal, "lauf", None)
+            if lauf is not None:
+                werte = lauf.setdefault(name, [0, 0.0])
+                werte[0] += 1; werte[1] += dauer
+
+    def zaehlen(self, name, anzahl=1):
+        with self.sperre:
+            self.zaehler[name] += anzahl
+
+    def lauf_beginnen(self):
+        self._lokal.lauf = {}
+
+    def lauf_beenden(self):
+        """Die Spans des Durchlaufs in diesem Thread als {Name: [Anzahl, Summe s]}."""
+        lauf, self._lokal.lauf = getattr(self._lokal, "lauf", None) or {}, None
+        if self.log and lauf:
+            with self.sperre, open(self.log, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"zeit": datetime.now().isoformat(timespec="milliseconds"),
+                                    "spans": {n: {"anzahl": a, "sekunden": round(d, 6)} for n, (a, d) in lauf.items()}}) + "\n")
+        return lauf
+
+    def als_json(self):
+        with self.sperre:
+            return {"spans": {n: {"anzahl": a, "summe_s": summe, "max_s": m} for n, (a, summe, m) in sorted(self.spans.items())},
+                    "zaehler": dict(sorted(self.zaehler.items()))}
+
+    def prometheus(self):
+        """Textformat für einen Prometheus-Scrape bzw. node_exporter-Textfile."""
+        daten = self.als_json()
+        zeilen = ["# HELP kvs_dauer_sekunden Laufzeit der gemessenen Abschnitte.", "# TYPE kvs_dauer_sekunden summary"]
+        for name, w in daten["spans"].items():
+            zeilen += [f'kvs_dauer_sekunden_count{{name="{name}"}} {w["anzahl"]}', f'kvs_dauer_sekunden_sum{{name="{name}"}} {w["summe_s"]:.6f}']
+        zeilen += ["# HELP kvs_dauer_sekunden_max Längste Laufzeit je Abschnitt.", "# TYPE kvs_dauer_sekunden_max gauge"]
+        zeilen += [f'kvs_dauer_sekunden_max{{name="{name}"}} {w["max_s"]:.6f}' for name, w in daten["spans"].items()]
+        zeilen += ["# HELP kvs_zaehler_total Zähler (Cache-Treffer, erzeugte Objekte, ...).", "# TYPE kvs_zaehler_total counter"]
+        zeilen += [f'kvs_zaehler_total{{name="{name}"}} {wert}' for name, wert in daten["zaehler"].items()]
+        return "\n".join(zeilen) + "\n"
+
+@st.cache_resource(show_spinner=False)
+def _geteilte_messwerte():
+    # Wie die Datenbank über alle Sessions und Skriptdurchläufe hinweg dieselbe Instanz
+    return Messwerte()
+
+MESSWERTE = _geteilte_messwerte()
+_AUS = nullcontext()
+
+def messen(name):
+    """with messen("name"): misst den Block, falls die Messung eingeschaltet ist."""
+    return MESSWERTE.span(name) if MESSWERTE.aktiv else _AUS
+
+def zaehlen(name, anzahl=1):
+    if MESSWERTE.aktiv:
+        MESSWERTE.zaehlen(name, anzahl)
+
+class Termin:
+    """Ein Termin, einmalig aus dem Text '01.03.2026 um 14:00 - Notiz' gelesen. Wird nicht verändert, sondern ersetzt.
+
+    Weicht die Dauer von TERMIN_DAUER ab, steht die Endzeit mit im Text: '01.03.2026 um 14:00-15:00 - Notiz'.
+    """
+    __slots__ = ("zeitpunkt", "notiz", "kunden_id", "dauer", "_text")
+
+    def __init__(self, zeitpunkt, notiz="", kunden_id=None, text=None, dauer=TERMIN_DAUER):
+        self.zeitpunkt = zeitpunkt  # None, wenn der Text nicht lesbar war
+        self.notiz = _intern(notiz)
+        self.kunden_id = kunden_id
+        self.dauer = dauer  # Minuten, unter einem Tag
+        # Originaltext nur aufheben, wenn er sich nicht aus Zeitpunkt, Dauer und Notiz ergibt
+        self._text = None if zeitpunkt is not None and text in (None, self._formatieren()) else text
+
+    def _formatieren(self):
+        z = self.zeitpunkt
+        uhrzeit = f"{z.hour:02d}:{z.minute:02d}"
+        if self.dauer != TERMIN_DAUER:
+            e = self.ende; uhrzeit += f"-{e.hour:02d}:{e.minute:02d}"
+        return f"{z.day:02d}.{z.month:02d}.{z.year:04d} um {uhrzeit} - {self.notiz}"
+
+    @property
+    def text(self):
+        return self._text or self._formatieren()
+
+    @property
+    def ende(self):
+        return self.zeitpunkt + timedelta(minutes=self.dauer)
+
+    @staticmethod
+    def from_text(t_str, kunden_id=None):
+        # Von Hand zerlegt statt strptime(), das beim Laden großer Dateien die meiste Zeit kostet
+        try:
+            p = t_str.split(" um ", 1); p2 = p[1].split(" - ", 1)
+            tag, monat, jahr = p[0].split("."); von, _, bis = p2[0].partition("-")
+            stunde, minute = von.split(":"); bis_stunde, bis_minute = bis.split(":") if bis else ("", "")
+            if not (tag + monat + jahr + stunde + minute).isdigit() or (bis and not (bis_stunde + bis_minute).isdigit()):
+                raise ValueError(t_str)
+            zeitpunkt = datetime(int(jahr), int(monat), int(tag), int(stunde), int(minute))
+            dauer = TERMIN_DAUER
+            if bis:
+                # Endzeit vor der Startzeit: Termin geht über Mitternacht
+                dauer = (int(bis_stunde) * 60 + int(bis_minute) - zeitpunkt.hour * 60 - zeitpunkt.minute) % 1440 or TERMIN_DAUER
+        except (ValueError, IndexError):
+            # Unlesbare Einträge bleiben erhalten, tauchen aber in keiner Terminliste auf
+            return Termin(None, kunden_id=kunden_id, text=t_str)
+        return Termin(zeitpunkt, p2[1] if len(p2) > 1 else "", kunden_id, text=t_str, dauer=dauer)
+
+def termine_lesen(termine, kunden_id):
+    """Wandelt Texte bzw. Termine in eine Liste von Terminen dieses Kunden um."""
+    liste = []
+    with messen("termine_lesen"):
+        for t in termine or []:
+            if isinstance(t, str):
+                t = Termin.from_text(t)
+            t.kunden_id = kunden_id
+            liste.append(t)
+    return liste
+
+def _aufrunden(zeitpunkt, raster):
+    """Auf die nächste volle Minute und dann auf ein Vielfaches von 'raster' Minuten ab Mitternacht aufrunden."""
+    z = zeitpunkt.replace(second=0, microsecond=0)
+    if z < zeitpunkt:
+        z += timedelta(minutes=1)
+    return z + timedelta(minutes=-(z.hour * 60 + z.minute) % raster)
+
+class TerminIndex:
+    """Alle lesbaren Termine aller Kunden, nach Zeitpunkt sortiert. Bereichsabfragen per bisect in O(log n + k).
+
+    Als Intervallstruktur genügt zusätzlich die längste vorkommende Dauer: Ein Termin, der
+    [von, bis) überschneidet, beginnt frühestens bei von - max_dauer.
+    """
+    def __init__(self):
+        self._zeiten = []
+        self._termine = []
+        self.unlesbar = 0
+        self.max_dauer = 0  # Minuten; sinkt beim Entfernen nicht, bleibt aber eine obere Schranke
+
+    def aufbauen(self, termine):
+        termine = list(termine)
+        lesbar = sorted((t for t in termine if t.zeitpunkt is not None), key=lambda t: t.zeitpunkt)
+        self._zeiten = [t.zeitpunkt for t in lesbar]
+        self._termine = lesbar
+        self.unlesbar = len(termine) - len(lesbar)
+        self.max_dauer = max((t.dauer for t in lesbar), default=0)
+
+    def hinzufuegen(self, termin):
+        if termin.zeitpunkt is None:
+            self.unlesbar += 1; return
+        i = bisect.bisect_right(self._zeiten, termin.zeitpunkt)
+        self._zeiten.insert(i, termin.zeitpunkt); self._termine.insert(i, termin)
+        self.max_dauer = max(self.max_dauer, termin.dauer)
+
+    def mehrere_hinzufuegen(self, termine):
+        lesbar = [t for t in termine if t.zeitpunkt is not None]
+        self.unlesbar += len(termine) - len(lesbar)
+        if len(lesbar) < 64:
+            for t in lesbar:
+                self.hinzufuegen(t)
+            return
+        # Zwei sortierte Läufe: sorted() führt sie in linearer Zeit zusammen
+        self._termine = sorted(self._termine + sorted(lesbar, key=lambda t: t.zeitpunkt), key=lambda t: t.zeitpunkt)
+        self._zeiten = [t.zeitpunkt for t in self._termine]
+        self.max_dauer = max(self.max_dauer, max(t.dauer for t in lesbar))
+
+    def entfernen(self, termin):
+        if termin.zeitpunkt is None:
+            self.unlesbar -= 1; return
+        i = bisect.bisect_left(self._zeiten, termin.zeitpunkt)
+        while i < len(self._zeiten) and self._zeiten[i] == termin.zeitpunkt:
+            if self._termine[i] is termin:
+                del self._zeiten[i]; del self._termine[i]
+                return
+            i += 1
+
+    def zwischen(self, von=None, bis=None):
+        lo = 0 if von is None else bisect.bisect_left(self._zeiten, von)
+        hi = len(self._zeiten) if bis is None else bisect.bisect_right(self._zeiten, bis)
+        return self._termine[lo:hi]
+
+    def anzahl(self, von, bis):
+        """len(zwischen(von, bis)) in O(log n)."""
+        return bisect.bisect_right(self._zeiten, bis) - bisect.bisect_left(self._zeiten, von)
+
+    def naechster(self, ab):
+        i = bisect.bisect_left(self._zeiten, ab)
+        return self._termine[i] if i < len(self._termine) else None
+
+    def ueberschneidungen(self, von, bis, ausser=None):
+        """Termine, die sich mit [von, bis) überschneiden (ohne 'ausser'), in O(log n + k)."""
+        lo = bisect.bisect_right(self._zeiten, von - timedelta(minutes=self.max_dauer))
+        hi = bisect.bisect_left(self._zeiten, bis)
+        return [t for t in self._termine[lo:hi] if t.ende > von and t is not ausser]
+
+    def freie_slots(self, von, bis, dauer=TERMIN_DAUER, anzahl=5, raster=15):
+        """Die ersten 'anzahl' freien Zeiträume von 'dauer' Minuten in [von, bis] innerhalb der
+        OEFFNUNGSZEITEN, Beginn auf 'raster' Minuten gerundet. Hinter einem belegten Zeitraum geht
+        es direkt an dessen Ende weiter, der Aufwand hängt also von den Treffern ab, nicht von n."""
+        laenge, (auf, zu) = timedelta(minutes=dauer), OEFFNUNGSZEITEN
+        slots, t = [], von
+        while len(slots) < anzahl:
+            t = _aufrunden(t, raster)
+            if t.hour < auf:
+                t = t.replace(hour=auf, minute=0)
+            if t.weekday() >= 5 or t + laenge > t.replace(hour=zu, minute=0):
+                t = (t + timedelta(days=1)).replace(hour=auf, minute=0)  # nächster Tag
+                if t > bis:
+                    break
+                continue
+            if t + laenge > bis:
+                break
+            belegt = self.ueberschneidungen(t, t + laenge)
+            if belegt:
+                t = max(b.ende for b in belegt)
+            else:
+                slots.append(t); t += laenge
+        return slots
+
+    def __len__(self):
+        return len(self._termine)
+
 class Kunde:
-    def __init__(self, anrede, vorname, nachname, geschlecht, alter, email, wohnorte, plz="", telefon="", mobil="", kunden_id=None, termine=None):
+    __slots__ = ("kunden_id", "anrede", "vorname", "nachname", "geschlecht", "alter", "email", "plz", "telefon", "mobil", "wohnorte", "termine", "version")
+
+    def __init__(self, anrede, vorname, nachname, geschlecht, alter, email, wohnorte, plz="", telefon="", mobil="", kunden_id=None, termine=None, version=0):
         self.kunden_id = kunden_id or str(uuid.uuid4())[:8]
-        self.anrede = anrede
+        self.anrede = _intern(anrede)
         self.vorname = vorname
         self.nachname = nachname
-        self.geschlecht = geschlecht
+        self.geschlecht = _intern(geschlecht)
         self.alter = alter
         self.email = email
         self.plz = plz
         self.telefon = telefon
         self.mobil = mobil
-        self.wohnorte = wohnorte if isinstance(wohnorte, list) else [wohnorte]
-        self.termine = termine if isinstance(termine, list) else []
+        self.wohnorte = [_intern(o) for o in wohnorte] if isinstance(wohnorte, list) else [_intern(wohnorte)]
+        self.termine = termine_lesen(termine if isinstance(termine, list) else [], self.kunden_id)
+        self.version = version  # zählt jeden gespeicherten Stand, lokale Änderungen erst beim Speichern
 
     def to_dict(self):
         return {
             "ID": self.kunden_id, "Anrede": self.anrede, "Vorname": self.vorname, 
             "Nachname": self.nachname, "Geschlecht": self.geschlecht, "Alter": self.alter,
             "E-Mail": self.email, "PLZ": self.plz, "Telefon": self.telefon, "Mobil": self.mobil,
-            "Wohnorte": ", ".join(self.wohnorte), "Termine": " | ".join(self.termine)
+            "Wohnorte": ", ".join(self.wohnorte), "Termine": " | ".join(t.text for t in self.termine),
+            "Version": self.version
         }
 
     def to_table_row(self):
@@ -71,46 +356,1464 @@ class Kunde:
             alter=data.get("Alter", 1), email=data.get("E-Mail", ""), plz=data.get("PLZ", ""),
             telefon=data.get("Telefon", ""), mobil=data.get("Mobil", ""), 
             wohnorte=data.get("Wohnorte", "").split(", ") if data.get("Wohnorte") else [],
-            termine=data.get("Termine", "").split(" | ") if data.get("Termine") else []
+            termine=data.get("Termine", "").split(" | ") if data.get("Termine") else [],
+            version=data.get("Version", 0)
         )
 
+SUCHFELDER = ("vorname", "nachname", "kunden_id", "wohnorte", "plz", "telefon", "mobil", "email")
+TERMIN_SUCHFELDER = ("vorname", "nachname", "kunden_id", "wohnorte", "plz", "telefon", "mobil")
+BUCHUNG_SUCHFELDER = ("vorname", "nachname", "kunden_id")
+
+def feldwert(kunde, feld):
+    wert = getattr(kunde, feld)
+    return ", ".join(wert) if feld == "wohnorte" else str(wert)
+
+ANREDEN = ["Herr", "Frau", "Divers"]
+GESCHLECHTER = ["Männlich", "Weiblich", "Divers"]
+
+def kunde_pruefen(anrede, geschlecht, vorname, nachname, alter, email, plz, wohnort, telefon, mobil):
+    """Eingaberegeln für einen Kunden; liefert die Fehlermeldungen (leer = gültig).
+
+    kunden_pruefen() prüft dieselben Regeln spaltenweise für den Massenimport.
+    """
+    errors = []
+    if not anrede: errors.append("Anrede fehlt.")
+    elif anrede not in ANREDEN: errors.append("Ungültige Anrede.")
+    if not geschlecht: errors.append("Geschlecht fehlt.")
+    elif geschlecht not in GESCHLECHTER: errors.append("Ungültiges Geschlecht.")
+    if not nachname: errors.append("Nachname fehlt.")
+    if not vorname: errors.append("Vorname fehlt.")
+    if not plz: errors.append("Postleitzahl fehlt.")
+    if not wohnort: errors.append("Wohnort fehlt.")
+    if not telefon: errors.append("Telefon fehlt.")
+    if plz and not plz.isdigit(): errors.append("PLZ darf nur Zahlen enthalten.")
+    if telefon and not telefon.isdigit(): errors.append("Telefon darf nur Zahlen enthalten.")
+    if mobil and mobil.strip() and not mobil.isdigit(): errors.append("Mobil darf nur Zahlen enthalten.")
+    if email and email.strip() and "@" not in email: errors.append("Ungültige E-Mail Adresse (@ fehlt).")
+    if not (str(alter).isdigit() and 1 <= int(alter) <= 120): errors.append("Alter muss zwischen 1 und 120 liegen.")
+    return errors
+
+class SuchIndex:
+    """Trigramm-Index über alle SUCHFELDER für die Teilstring-Suche.
+
+    Pro Trigramm wird eine sortierte array('I') interner Kundennummern gehalten. Die kürzeste
+    Liste der Trigramme des Suchbegriffs liefert die Kandidaten, die danach gegen die
+    kleingeschriebenen Feldwerte geprüft werden. Die Treffer sind damit dieselben wie bei
+    'begriff.lower() in feld.lower()'. Begriffe unter drei Zeichen prüfen alle Kunden.
+    """
+    TRENNER = "\x1f"
+    BLOCK = 20_000  # Kunden pro Schritt beim Aufbauen, begrenzt den Speicherbedarf der Zwischen-Arrays
+
+    def __init__(self):
+        self._listen = {}   # Trigramm -> array('I') sortierter Nummern
+        self._texte = {}    # Nummer -> kleingeschriebene Feldwerte, mit TRENNER verbunden
+        self._ids = {}      # Nummer -> kunden_id
+        self._nummern = {}  # kunden_id -> Nummer (aufsteigend = Reihenfolge in Datenbank.kunden)
+        self._naechste = 0
+
+    @staticmethod
+    def _trigramme(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _trigramme_kunde(self, text):
+        return set().union(*map(self._trigramme, text.split(self.TRENNER)))
+
+    def aufbauen(self, kunden):
+        """Baut den ganzen Index auf einmal: Listen werden blockweise aus sortierten Paaren
+        (Trigramm, Nummer) angehängt statt Kunde für Kunde einsortiert."""
+        self.__init__()
+        for k in kunden:
+            self._nummern[k.kunden_id] = self._naechste; self._ids[self._naechste] = k.kunden_id
+            self._texte[self._naechste] = self.TRENNER.join(feldwert(k, f).lower() for f in SUCHFELDER)
+            self._naechste += 1
+        texte = list(self._texte.values())
+        for start in range(0, len(texte), self.BLOCK):
+            self._block_indizieren(texte[start:start + self.BLOCK], start)
+
+    def _block_indizieren(self, texte, start):
+        # Jedes Trigramm als eine Zahl aus drei Codepoints à 21 Bit, die Kunden durch TRENNER getrennt
+        zeichen = np.frombuffer((self.TRENNER.join(texte) + self.TRENNER).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        nummern = np.repeat(np.arange(len(texte), dtype=np.uint64), [len(t) + 1 for t in texte])[:-2]
+        a, b, c = zeichen[:-2], zeichen[1:-1], zeichen[2:]
+        trenner = ord(self.TRENNER)
+        gueltig = (a != trenner) & (b != trenner) & (c != trenner)  # nicht über Feld- oder Kundengrenzen
+        codes, trigramme = pd.factorize(((a << 42) | (b << 21) | c)[gueltig])
+        # Sortiert nach Trigramm, darin nach Nummer; doppelte Trigramme eines Kunden fallen weg
+        n = np.uint64(len(texte))
+        paare = codes.astype(np.uint64) * n + nummern[gueltig]
+        if not len(paare):
+            return  # lauter Felder unter drei Zeichen
+        paare.sort()
+        paare = paare[np.concatenate(([True], paare[1:] != paare[:-1]))]
+        grenzen = np.searchsorted(paare // n, np.arange(1, len(trigramme), dtype=np.uint64))
+        nummern = (paare % n + np.uint64(start)).astype(np.uint32)
+        maske = (1 << 21) - 1
+        for g, teil in zip(trigramme.tolist(), np.split(nummern, grenzen)):
+            g = chr(g >> 42) + chr(g >> 21 & maske) + chr(g & maske)
+            liste = self._listen.get(g)
+            if liste is None:
+                liste = self._listen[g] = array("I")
+            liste.frombytes(teil.tobytes())
+
+    def hinzufuegen(self, kunde):
+        nr = self._nummern.get(kunde.kunden_id)
+        if nr is None:
+            nr = self._naechste; self._naechste += 1
+            self._nummern[kunde.kunden_id] = nr; self._ids[nr] = kunde.kunden_id
+        text = self.TRENNER.join(feldwert(kunde, f).lower() for f in SUCHFELDER)
+        self._texte[nr] = text
+        for g in self._trigramme_kunde(text):
+            liste = self._listen.get(g)
+            if liste is None:
+                self._listen[g] = array("I", (nr,))
+            elif liste[-1] < nr:
+                liste.append(nr)
+            else:
+                bisect.insort(liste, nr)
+
+    def entfernen(self, kunden_id, endgueltig=True):
+        """endgueltig=False behält die Position des Kunden, z. B. beim Bearbeiten."""
+        nr = self._nummern.get(kunden_id)
+        if nr is None:
+            return
+        for g in self._trigramme_kunde(self._texte[nr]):
+            liste = self._listen[g]
+            i = bisect.bisect_left(liste, nr)
+            if i < len(liste) and liste[i] == nr:
+                del liste[i]
+            if not liste:
+                del self._listen[g]
+        if endgueltig:
+            del self._nummern[kunden_id], self._ids[nr], self._texte[nr]
+
+    def suchen(self, begriff, felder=SUCHFELDER):
+        b = begriff.lower()
+        if len(b) < 3:
+            kandidaten = self._texte.keys()
+        else:
+            listen = [self._listen.get(g) for g in self._trigramme(b)]
+            if not all(listen):
+                return []
+            kandidaten = min(listen, key=len)
+        texte = self._texte
+        zaehlen("suche.vollscan" if len(b) < 3 else "suche.trigramm")
+        zaehlen("suche.kandidaten", len(kandidaten))
+        treffer = [nr for nr in kandidaten if b in texte[nr]]
+        if len(felder) < len(SUCHFELDER):
+            spalten = [SUCHFELDER.index(f) for f in felder]
+            treffer = [nr for nr in treffer if any(b in wert for i, wert in enumerate(texte[nr].split(self.TRENNER)) if i in spalten)]
+        return [self._ids[nr] for nr in treffer]
+
+class TabellenAnsicht:
+    """Zwischengespeicherte DataFrames für die Kundenstamm- und die Termintabelle.
+
+    Änderungen über die Datenbank merken nur die betroffene kunden_id vor. Beim nächsten
+    Zugriff werden genau diese Zeilen ersetzt, gelöscht oder angehängt, statt die Tabelle
+    bei jedem Rerun aus allen Kunden neu zu bauen: wenige Änderungen als Slices, mehr mit
+    einem concat() und einem take(). Die Terminzeilen eines Kunden findet searchsorted()
+    über die gemerkten Zeitpunkte, neue Zeilen werden an ihrer Position eingefügt statt neu
+    zu sortieren. Sind zu viele Kunden vorgemerkt (Import, Nachziehen eines großen
+    Schreibvorgangs), wird komplett neu gebaut. Gecachte Frames werden nie verändert,
+    sondern ersetzt, damit parallel rendernde Sessions einen konsistenten Stand sehen.
+    """
+    KUNDEN_SPALTEN = ["ID", "Anrede", "Nachname", "Vorname", "Geschlecht", "Alter", "Mobil", "Telefon", "E-Mail", "Wohnort", "PLZ", "Termine vorhanden?"]
+    TERMIN_SPALTEN = ["ID", "Anrede", "Vorname", "Nachname", "Telefon", "Mobil", "Datum", "Uhrzeit", "Bis", "Notiz", "idx", "sort"]
+    PATCHEN_MAX = 200  # mehr vorgemerkte Kunden (mindestens aber 1 % der Tabelle) -> komplett neu bauen
+    SLICES_MAX = 16  # bis zu so vielen Ereignissen wird aus Slices zusammengesetzt statt per take() kopiert
+    STUECKE_MAX = 256  # so viele Slices darf eine Tabelle ansammeln, bevor sie per take() am Stück neu angelegt wird
+
+    def __init__(self, kunden):
+        self._kunden = kunden  # Datenbank.kunden
+        self.zuruecksetzen()
+
+    def zuruecksetzen(self):
+        self._kunden_df = None
+        self._termine_df = None
+        self._zeitpunkte = {}  # kunden_id -> Zeitpunkte seiner Zeilen in _termine_df
+        self._stuecke = {"kunden": 0, "termine": 0}  # angesammelte Slices je Tabelle
+        self._offen = {}  # kunden_id -> None, geordnet wie die Änderungen
+
+    def markieren(self, kunden_id):
+        self._offen[kunden_id] = None
+
+    @staticmethod
+    def _termin_zeilen(k):
+        return [{"ID": k.kunden_id, "Anrede": k.anrede, "Vorname": k.vorname, "Nachname": k.nachname, "Telefon": k.telefon, "Mobil": k.mobil,
+                 "Datum": t.zeitpunkt.strftime('%d.%m.%Y'), "Uhrzeit": t.zeitpunkt.strftime('%H:%M'), "Bis": t.ende.strftime('%H:%M'), "Notiz": t.notiz, "idx": idx, "sort": t.zeitpunkt}
+                for idx, t in enumerate(k.termine) if t.zeitpunkt is not None]
+
+    def _kunden_frame(self, kunden):
+        return pd.DataFrame([k.to_table_row() for k in kunden], columns=self.KUNDEN_SPALTEN, index=[k.kunden_id for k in kunden])
+
+    def _termin_frame(self, kunden):
+        for k in kunden:
+            self._zeitpunkte[k.kunden_id] = [t.zeitpunkt for t in k.termine if t.zeitpunkt is not None]
+        df = pd.DataFrame([z for k in kunden for z in self._termin_zeilen(k)], columns=self.TERMIN_SPALTEN)
+        return df.sort_values("sort", kind="stable", ignore_index=True)
+
+    def _aktualisieren(self):
+        if self._kunden_df is not None and len(self._offen) > max(self.PATCHEN_MAX, len(self._kunden_df) // 100):
+            self.zuruecksetzen()
+        if self._kunden_df is None:
+            kunden = list(self._kunden.values())
+            with messen("tabelle.aufbauen"):
+                self._kunden_df, self._termine_df = self._kunden_frame(kunden), self._termin_frame(kunden)
+            zaehlen("tabelle.zeilen_erzeugt", len(kunden))
+        elif not self._offen:
+            zaehlen("tabelle.cache_treffer")
+        else:
+            zaehlen("tabelle.zeilen_erzeugt", len(self._offen))
+            self._patchen()
+
+    def _patchen(self):
+        with messen("tabelle.patchen"):
+            offen = list(self._offen); self._offen = {}
+            vorhanden = [self._kunden[k_id] for k_id in offen if k_id in self._kunden]
+            self._kunden_df = self._kunden_patchen(offen, vorhanden)
+            self._termine_df = self._termine_patchen(offen, vorhanden)
+
+    def _kunden_patchen(self, offen, vorhanden):
+        # Geänderte Zeilen an ihrer Position ersetzen, neue ans Ende, gelöschte weglassen
+        df = self._kunden_df
+        neu = self._kunden_frame(vorhanden)
+        nummer = {k.kunden_id: j for j, k in enumerate(vorhanden)}
+        ereignisse = []
+        for k_id, p in zip(offen, df.index.get_indexer(offen)):
+            if p >= 0:
+                ereignisse.append((p, 1, 0))
+            if k_id in nummer:
+                ereignisse.append((p if p >= 0 else len(df), 0, nummer[k_id]))
+        ergebnis = self._zusammensetzen("kunden", df, ereignisse, neu)
+        if len(ergebnis) == len(df) and all(p >= 0 for p in df.index.get_indexer(nummer)):
+            ergebnis.index = df.index  # dieselben IDs in derselben Reihenfolge: Hashtabelle des Index weiterverwenden
+        return ergebnis
+
+    def _termine_patchen(self, offen, vorhanden):
+        tdf = self._termine_df
+        zeiten, ids = tdf["sort"].to_numpy(), tdf["ID"]
+        ereignisse = set()
+        for k_id in offen:
+            for z in self._zeitpunkte.pop(k_id, ()):
+                lo, hi = zeiten.searchsorted(np.datetime64(z), "left"), zeiten.searchsorted(np.datetime64(z), "right")
+                ereignisse.update((lo + i, 1, 0) for i in np.flatnonzero(ids.iloc[lo:hi].to_numpy() == k_id))
+        neu = self._termin_frame(vorhanden)
+        if tdf.empty:
+            return neu
+        # Hinter gleichen Zeitpunkten einfügen, wie es ein stabiles Sortieren auch täte
+        if not neu.empty:
+            ereignisse.update((p, 0, j) for j, p in enumerate(zeiten.searchsorted(neu["sort"].to_numpy(), "right")))
+        return self._zusammensetzen("termine", tdf, ereignisse, neu, ignore_index=True)
+
+    def _zusammensetzen(self, name, df, ereignisse, neu, ignore_index=False):
+        """df mit den Ereignissen (Position, 0 = Zeile j aus 'neu' davor einfügen / 1 = Zeile entfernen, j)."""
+        ereignisse = sorted(ereignisse)
+        if len(ereignisse) <= self.SLICES_MAX and self._stuecke[name] < self.STUECKE_MAX:
+            # Wenige Ereignisse: die Zeilen dazwischen bleiben Slices von df, die Spalten werden nicht kopiert
+            teile, start = [], 0
+            for p, art, j in ereignisse:
+                teile.append(df.iloc[start:p])
+                if art == 0:
+                    teile.append(neu.iloc[j:j + 1]); start = p
+                else:
+                    start = p + 1
+            teile.append(df.iloc[start:])
+            teile = [t for t in teile if not t.empty]
+            self._stuecke[name] += len(teile)
+            return pd.concat(teile, ignore_index=ignore_index) if teile else df.iloc[:0]
+        # Sonst ein concat() und ein take(): alte Zeile i bekommt den Schlüssel 2i+1, vor Position p
+        # eingefügte Zeilen 2p. Das legt die Spalten zugleich wieder am Stück an.
+        e = np.array(ereignisse, dtype=np.int64).reshape(-1, 3)
+        behalten = np.ones(len(df), dtype=bool); behalten[e[e[:, 1] == 1, 0]] = False
+        alt, einfuegen = np.flatnonzero(behalten), e[e[:, 1] == 0]
+        schluessel = np.concatenate((2 * alt + 1, 2 * einfuegen[:, 0]))
+        zeilen = np.concatenate((alt, len(df) + einfuegen[:, 2]))
+        basis = neu if df.empty else pd.concat([df, neu], ignore_index=ignore_index) if len(neu) else df
+        ergebnis = basis.take(zeilen[np.argsort(schluessel, kind="stable")])
+        self._stuecke[name] = 0
+        return ergebnis.reset_index(drop=True) if ignore_index else ergebnis
+
+    def kunden(self, kunden_ids=None):
+        self._aktualisieren()
+        df = self._kunden_df
+        return df if kunden_ids is None else df[df.index.isin(kunden_ids)]
+
+    def termine(self, kunden_ids=None):
+        self._aktualisieren()
+        df = self._termine_df
+        return df if kunden_ids is None else df[df["ID"].isin(kunden_ids)]
+
+def _alter_zahl(alter):
+    alter = str(alter)
+    return int(alter) if alter.isdigit() and int(alter) > 0 else None
+
+class Kennzahlen:
+    """Zähler für die Startseite, bei jeder Änderung fortgeschrieben statt pro Aufruf über alle Kunden berechnet."""
+    def __init__(self):
+        self.zuruecksetzen()
+
+    def zuruecksetzen(self):
+        self.kunden = 0
+        self.alter_summe = 0
+        self.alter_anzahl = 0
+        self.altersgruppen = Counter()  # 20 -> Kunden von 20 bis 29 Jahren
+        self.plz_regionen = Counter()  # erste Ziffer der PLZ, "?" ohne gültige PLZ
+        self.termine_pro_tag = Counter()  # date -> Anzahl
+        self.termine_pro_woche = Counter()  # (ISO-Jahr, ISO-Woche) -> Anzahl
+
+    def aufbauen(self, kunden):
+        self.zuruecksetzen()
+        for kunde in kunden:
+            self.hinzufuegen(kunde)
+
+    def hinzufuegen(self, kunde, anzahl=1):
+        self.kunden += anzahl
+        alter = _alter_zahl(kunde.alter)
+        if alter:
+            self.alter_summe += anzahl * alter; self.alter_anzahl += anzahl
+            self._zaehlen(self.altersgruppen, alter // 10 * 10, anzahl)
+        self._zaehlen(self.plz_regionen, kunde.plz[:1] if kunde.plz[:1].isdigit() else "?", anzahl)
+        for t in kunde.termine:
+            if t.zeitpunkt is not None:
+                tag = t.zeitpunkt.date()
+                self._zaehlen(self.termine_pro_tag, tag, anzahl)
+                self._zaehlen(self.termine_pro_woche, tag.isocalendar()[:2], anzahl)
+
+    def entfernen(self, kunde):
+        self.hinzufuegen(kunde, -1)
+
+    @staticmethod
+    def _zaehlen(zaehler, schluessel, anzahl):
+        zaehler[schluessel] += anzahl
+        if zaehler[schluessel] <= 0:
+            del zaehler[schluessel]
+
+    def kopfwerte(self, heute):
+        """Die Kennzahlen oben auf der Startseite. Liest nur einzelne Zähler, darf daher auch während
+        des Ladens ohne Sperre aufgerufen werden."""
+        tag = heute.date()
+        return {
+            "kunden": self.kunden,
+            "alter_schnitt": self.alter_summe / self.alter_anzahl if self.alter_anzahl else 0.0,
+            "termine_heute": self.termine_pro_tag[tag],
+            "termine_woche": self.termine_pro_woche[tag.isocalendar()[:2]],
+        }
+
+    def uebersicht(self, heute, wochen=8):
+        """Alle Werte der Startseite zum Stichtag 'heute', unabhängig von der Anzahl der Kunden und Termine."""
+        tag = heute.date()
+        montag = tag - timedelta(days=tag.weekday())
+        return {
+            **self.kopfwerte(heute),
+            "altersgruppen": dict(sorted(self.altersgruppen.items())),
+            "plz_regionen": dict(sorted(self.plz_regionen.items())),
+            "termine_pro_woche": {w: self.termine_pro_woche[w.isocalendar()[:2]] for w in (montag + timedelta(weeks=i) for i in range(wochen))},
+        }
+
 class Datenbank:
     def __init__(self):
         self.kunden = {}
+        self.speicher = None
+        # Änderungen seit dem letzten speichern() -> nur diese landen im Journal
+        self.geaendert = set()
+        self.geloescht = set()
+        # Gespeicherter Stand (to_dict) geänderter Kunden, Basis für zusammenfuehren()
+        self.basis = {}
+        # Eine Instanz wird von allen Sessions geteilt: Schreiben nur unter der Sperre,
+        # 'version' zählt jede gespeicherte Änderung bzw. jedes Neuladen hoch.
+        self.sperre = threading.RLock()
+        self.version = 0
+        self.termin_index = TerminIndex()
+        self.such_index = SuchIndex()
+        self.tabellen = TabellenAnsicht(self.kunden)
+        self.kennzahlen = Kennzahlen()
+        self._massenimport = False
+        self.geladen = threading.Event()
+        self.geladen.set()
     def hinzufuegen(self, kunde):
-        self.kunden[kunde.kunden_id] = kunde
+        with self.sperre:
+            if kunde.kunden_id in self.kunden:
+                self._basis_merken(self.kunden[kunde.kunden_id])
+                self._entindizieren(self.kunden[kunde.kunden_id], endgueltig=False)
+            self.kunden[kunde.kunden_id] = kunde
+            self._indizieren(kunde)
+            self.markieren(kunde.kunden_id)
+    def hinzufuegen_viele(self, kunden):
+        """Wie hinzufuegen() für einen ganzen Block, der Terminindex wird nur einmal zusammengeführt."""
+        with self.sperre:
+            neue_termine = {}  # je ID, damit eine im selben Block doppelte ID keine verwaisten Termine hinterlässt
+            for kunde in kunden:
+                alt = self.kunden.get(kunde.kunden_id)
+                if alt is not None:
+                    self._basis_merken(alt)
+                    self._entindizieren(alt, endgueltig=False)
+                self.kunden[kunde.kunden_id] = kunde
+                self.kennzahlen.hinzufuegen(kunde)
+                if not self._massenimport:
+                    self.such_index.hinzufuegen(kunde)
+                    self.tabellen.markieren(kunde.kunden_id)
+                    neue_termine[kunde.kunden_id] = kunde.termine
+                self.markieren(kunde.kunden_id)
+            self.termin_index.mehrere_hinzufuegen([t for termine in neue_termine.values() for t in termine])
     def bearbeiten(self, kunden_id, **kwargs):
-        if kunden_id in self.kunden:
-            for key, value in kwargs.items():
-                if hasattr(self.kunden[kunden_id], key):
-                    setattr(self.kunden[kunden_id], key, value)
+        with self.sperre:
+            if kunden_id in self.kunden:
+                kunde = self.kunden[kunden_id]
+                self._basis_merken(kunde)
+                self._entindizieren(kunde, endgueltig=False)
+                for key, value in kwargs.items():
+                    if key == "termine":
+                        value = termine_lesen(value, kunden_id)
+                    if hasattr(kunde, key):
+                        setattr(kunde, key, value)
+                self._indizieren(kunde)
+                self.markieren(kunden_id)
     def loeschen(self, kunden_id):
-        self.kunden.pop(kunden_id, None)
+        with self.sperre:
+            kunde = self.kunden.pop(kunden_id, None)
+            if kunde is not None:
+                self._basis_merken(kunde)
+                self._entindizieren(kunde)
+                self.geaendert.discard(kunden_id)
+                self.geloescht.add(kunden_id)
+    def markieren(self, kunden_id):
+        self.geloescht.discard(kunden_id)
+        self.geaendert.add(kunden_id)
+    def _basis_merken(self, kunde):
+        if kunde.kunden_id not in self.basis:
+            self.basis[kunde.kunden_id] = kunde.to_dict()
+    def basis_version(self, kunden_id):
+        """Version des gespeicherten Stands, auf dem unsere Änderung an kunden_id aufbaut."""
+        if kunden_id in self.basis:
+            return self.basis[kunden_id]["Version"]
+        return self.kunden[kunden_id].version if kunden_id in self.kunden else 0
+    def gespeichert(self):
+        self.geaendert.clear(); self.geloescht.clear(); self.basis.clear()
 
-def speichern(db, datei="kunden.json"):
-    with open(datei, "w") as f:
-        json.dump({k_id: k.to_dict() for k_id, k in db.kunden.items()}, f, indent=4)
+    def uebernehmen(self, kunden_id, kunde):
+        """Setzt einen anderswo gespeicherten Stand ein (None = gelöscht), ohne ihn als eigene Änderung zu markieren."""
+        with self.sperre:
+            alt = self.kunden.get(kunden_id)
+            if alt is not None:
+                self._entindizieren(alt, endgueltig=kunde is None)
+            if kunde is None:
+                self.kunden.pop(kunden_id, None)
+            else:
+                self.kunden[kunden_id] = kunde
+                self._indizieren(kunde)
 
-def laden(datei="kunden.json"):
-    db = Datenbank()
-    if os.path.exists(datei):
-        with open(datei, "r") as f:
+    def _indizieren(self, kunde):
+        # Die Kennzahlen laufen auch im Massenimport mit, die Ladeseite zeigt sie schon während des Ladens
+        self.kennzahlen.hinzufuegen(kunde)
+        if not self._massenimport:
+            for t in kunde.termine:
+                self.termin_index.hinzufuegen(t)
+            self.such_index.hinzufuegen(kunde)
+            self.tabellen.markieren(kunde.kunden_id)
+    def _entindizieren(self, kunde, endgueltig=True):
+        self.kennzahlen.entfernen(kunde)
+        if not self._massenimport:
+            for t in kunde.termine:
+                self.termin_index.entfernen(t)
+            self.such_index.entfernen(kunde.kunden_id, endgueltig)
+            self.tabellen.markieren(kunde.kunden_id)
+    def leeren(self):
+        """Alle Kunden verwerfen, z. B. vor dem Neueinlesen (nur im Massenimport, der die Indizes danach neu aufbaut)."""
+        self.kunden.clear(); self.kennzahlen.zuruecksetzen()
+
+    @contextmanager
+    def massenimport(self):
+        """Indizes während vieler Einfügungen aussetzen und danach einmal komplett aufbauen."""
+        with self.sperre:
+            self._massenimport = True
+            try:
+                yield self
+            finally:
+                self._massenimport = False
+                self.termin_index.aufbauen(t for k in self.kunden.values() for t in k.termine)
+                self.such_index.aufbauen(self.kunden.values())
+                self.tabellen.zuruecksetzen()
+
+    def neu_laden(self):
+        with self.sperre, self.massenimport():
+            self.leeren()
+            self.speicher.laden(self)
+            self.version += 1
+
+    def im_hintergrund_laden(self):
+        """Lädt die Kunden in einem eigenen Thread. Bis 'geladen' gesetzt ist, sind nur
+        len(kunden) und der Ladefortschritt aussagekräftig, alles andere wartet auf die Sperre."""
+        self.geladen.clear()
+        def _laden():
+            try:
+                with self.massenimport():
+                    self.speicher.laden(self)
+            except Exception as e:
+                self.speicher.ladefehler = f"Laden fehlgeschlagen: {e}"
+                raise
+            finally:
+                self.geladen.set()
+        threading.Thread(target=_laden, daemon=True).start()
+
+    def suchen(self, begriff, felder=SUCHFELDER):
+        """Kunden, bei denen 'begriff' (ohne Groß-/Kleinschreibung) in einem der Felder vorkommt."""
+        with self.sperre, messen("suchen"):
+            if not begriff:
+                return list(self.kunden.values())
+            return [self.kunden[k_id] for k_id in self.such_index.suchen(begriff, felder)]
+
+    def termine_zwischen(self, von=None, bis=None):
+        """Alle lesbaren Termine in [von, bis], nach Zeitpunkt sortiert."""
+        with self.sperre:
+            return self.termin_index.zwischen(von, bis)
+
+    def naechster_termin(self, ab):
+        with self.sperre:
+            return self.termin_index.naechster(ab)
+
+    def ueberschneidungen(self, von, bis, ausser=None):
+        """Alle Termine aller Kunden, die sich mit [von, bis) überschneiden."""
+        with self.sperre:
+            return self.termin_index.ueberschneidungen(von, bis, ausser)
+
+    def freie_slots(self, von, bis, dauer=TERMIN_DAUER, anzahl=5):
+        with self.sperre:
+            return self.termin_index.freie_slots(von, bis, dauer, anzahl)
+
+    def kennzahlen_uebersicht(self, heute):
+        with self.sperre:
+            # Dieselbe Spanne wie die Liste "Kommende Termine": ab jetzt, nicht ab Mitternacht
+            return {**self.kennzahlen.uebersicht(heute), "termine_7_tage": self.termin_index.anzahl(heute, heute + timedelta(days=7))}
+
+    def kunden_tabelle(self, kunden_ids=None):
+        """Kundenstamm als DataFrame (Index = kunden_id), optional auf kunden_ids gefiltert."""
+        with self.sperre, messen("tabelle.kunden"):
+            return self.tabellen.kunden(kunden_ids)
+
+    def termin_tabelle(self, kunden_ids=None):
+        """Alle lesbaren Termine als DataFrame, nach Zeitpunkt sortiert, optional auf kunden_ids gefiltert."""
+        with self.sperre, messen("tabelle.termine"):
+            return self.tabellen.termine(kunden_ids)
+
+def zusammenfuehren(basis, unsere, ihre):
+    """Dreiwege-Merge zweier gespeicherter Stände eines Kunden (Dicts wie Kunde.to_dict(), None = gelöscht).
+
+    Felder, die nur eine Seite gegenüber 'basis' geändert hat, werden übernommen; haben beide
+    dasselbe Feld geändert, gewinnt 'unsere'. Termine werden als Menge zusammengeführt, damit keine
+    Buchung verloren geht. Eine Änderung hat Vorrang vor einer Löschung.
+    """
+    if unsere is None or ihre is None:
+        return ihre if unsere is None else unsere
+    basis = basis or {}
+    ergebnis = {feld: ihre.get(feld) if wert == basis.get(feld) else wert for feld, wert in unsere.items()}
+    b, u, i = ([t for t in d.get("Termine", "").split(" | ") if t] for d in (basis, unsere, ihre))
+    # Eigene Termine, außer die andere Seite hat sie gelöscht, plus deren neue Termine
+    termine = [t for t in u if t in i or t not in b] + [t for t in i if t not in u and t not in b]
+    ergebnis["Termine"] = " | ".join(termine)
+    return ergebnis
+
+class Speicher:
+    """Schnittstelle der Speicher-Backends einer Datenbank."""
+    def __init__(self, datei):
+        self.datei = datei
+        self.fortschritt = 0.0  # Anteil der beim Laden bereits gelesenen Daten
+        self.konflikte = 0  # beim Speichern zusammengeführte gleichzeitige Änderungen
+        self.ladefehler = None  # Text, wenn die Daten nur teilweise gelesen werden konnten
+    def laden(self, db):
+        raise NotImplementedError
+    def schreiben(self, db):
+        raise NotImplementedError
+    def neu_schreiben(self, db):
+        raise NotImplementedError
+    def extern_geaendert(self):
+        """True, wenn ein anderer Prozess die Daten seit unserem letzten Laden/Schreiben geändert hat."""
+        return False
+    def aktualisieren(self, db):
+        """Übernimmt die Änderungen anderer Prozesse, im einfachsten Fall durch komplettes Neuladen."""
+        db.neu_laden()
+
+    def _konflikt_loesen(self, db, kunden_id, ihre):
+        """Führt unsere ungespeicherte Änderung mit dem inzwischen von einem anderen Prozess gespeicherten
+        Stand 'ihre' zusammen und setzt das Ergebnis lokal ein. False, wenn danach nichts mehr zu schreiben ist."""
+        unsere = db.kunden[kunden_id].to_dict() if kunden_id in db.kunden else None
+        ergebnis = zusammenfuehren(db.basis.get(kunden_id), unsere, ihre)
+        self.konflikte += 1; zaehlen("speichern.konflikte")
+        if ergebnis != unsere:
+            db.uebernehmen(kunden_id, Kunde.from_dict(ergebnis) if ergebnis else None)
+        return ergebnis != ihre
+
+class JournalSpeicher(Speicher):
+    """Snapshot (kunden.json) plus Append-only-Journal (kunden.json.journal).
+
+    Jede Änderung wird als eine Zeile {"op": "upsert"|"delete", ...} an das Journal
+    angehängt, die Schreibkosten hängen also nur von der Änderung ab. Ab einer
+    gewissen Journal-Länge wird im Hintergrund ein neuer Snapshot geschrieben
+    (tmp-Datei + fsync + os.replace) und das Journal auf den Rest gekürzt.
+    Upserts/Deletes sind idempotent, ein Absturz zwischen zwei Schritten ist daher harmlos.
+
+    Mehrere Prozesse dürfen dieselbe Datei nutzen: Angehängt wird nur unter einer Dateisperre
+    (kunden.json.lock), vorher werden die Einträge der anderen Prozesse nachgezogen. Betrifft
+    einer davon einen Kunden, den wir selbst geändert haben, werden beide Stände per
+    zusammenfuehren() vereinigt. Eine Kompaktierung beginnt das Journal mit einer Kopfzeile
+    {"op": "kopf", "generation": ...}; wer eine andere Generation vorfindet, liest neu ein.
+    """
+    KOMPAKTIEREN_AB = 1000  # Mindestanzahl Journal-Einträge vor einer Kompaktierung
+
+    def __init__(self, datei):
+        super().__init__(datei)
+        self.journal = datei + ".journal"
+        self.sperrdatei = datei + ".lock"
+        self.sperre = threading.Lock()
+        self.eintraege = 0
+        self._kompaktierung = None
+        self.bekannter_stand = None
+        # Bis hierhin ist das Journal (Generation 'generation') in unsere Datenbank eingeflossen
+        self.generation = None
+        self.gelesen_bis = 0
+
+    def _stand(self):
+        stand = []
+        for pfad in (self.datei, self.journal):
             try:
-                daten = json.load(f)
-                for info in daten.values():
-                    db.hinzufuegen(Kunde.from_dict(info))
-            except: pass
+                info = os.stat(pfad); stand.append((info.st_mtime_ns, info.st_size))
+            except FileNotFoundError:
+                stand.append(None)
+        return tuple(stand)
+
+    def extern_geaendert(self):
+        return self._stand() != self.bekannter_stand
+
+    def laden(self, db):
+        with messen("laden"):
+            self._laden(db)
+        zaehlen("laden.kunden", len(db.kunden))
+
+    def _laden(self, db):
+        self.fortschritt = 0.0
+        while True:
+            with _dateisperre(self.sperrdatei):
+                # Die geöffneten Dateien bleiben ein zusammengehöriger Stand, auch wenn
+                # ein anderer Prozess währenddessen kompaktiert und beide ersetzt
+                snapshot, journal = _oeffnen(self.datei), _oeffnen(self.journal)
+            self._einlesen(db, snapshot, journal)
+            with self.sperre, _dateisperre(self.sperrdatei):
+                if self._nachziehen(db):
+                    self.bekannter_stand = self._stand()
+                    break
+            db.leeren()
+        self.fortschritt = 1.0
+        db.gespeichert()
+
+    def aktualisieren(self, db):
+        with self.sperre, _dateisperre(self.sperrdatei), messen("nachziehen"):
+            aktuell = self._nachziehen(db)
+            if aktuell:
+                self.bekannter_stand = self._stand()
+                db.version += 1
+        if not aktuell:
+            db.neu_laden()
+
+    def _einlesen(self, db, snapshot, journal):
+        self.eintraege = 0; self.generation = None; self.gelesen_bis = 0; self.ladefehler = None
+        if snapshot:
+            with snapshot:
+                try:
+                    for info in self._snapshot_lesen(snapshot):
+                        db.hinzufuegen(Kunde.from_dict(info))
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    # Den Rest nicht raten: der Snapshot bleibt unangetastet, bis jemand ihn repariert
+                    self.ladefehler = f"{self.datei} ist beschädigt, nach {len(db.kunden)} Kunden abgebrochen ({e})"
+                    print(f"KVS: {self.ladefehler}", file=sys.stderr)
+        if journal:
+            with journal:
+                self.generation, self.gelesen_bis = self._kopf_lesen(journal)
+                for eintrag, ende in self._eintraege(journal):
+                    if eintrag["op"] == "delete":
+                        db.loeschen(eintrag["ID"])
+                    else:
+                        db.hinzufuegen(Kunde.from_dict(eintrag["daten"]))
+                    self.gelesen_bis = ende
+                    self.eintraege += 1
+
+    def _snapshot_lesen(self, f, blockgroesse=1 << 16):
+        """Liest das Snapshot-Objekt {"ID": {...}, ...} blockweise und liefert die Kunden-Dicts
+        einzeln, ohne die ganze Datei als Text und als Dict gleichzeitig im Speicher zu halten."""
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder("utf-8")()
+        groesse = os.fstat(f.fileno()).st_size or 1
+        puffer, pos, gelesen, ende = "", 0, 0, False
+
+        def nachladen():
+            nonlocal puffer, pos, gelesen, ende
+            block = f.read(max(blockgroesse, len(puffer) - pos))
+            gelesen += len(block); ende = not block
+            puffer = puffer[pos:] + utf8.decode(block, final=ende); pos = 0
+            self.fortschritt = gelesen / groesse * 0.95
+
+        def zeichen():
+            # Nächstes Nicht-Leerzeichen, ohne es zu verbrauchen (None am Dateiende)
+            nonlocal pos
+            while True:
+                while pos < len(puffer) and puffer[pos] in " \t\r\n":
+                    pos += 1
+                if pos < len(puffer):
+                    return puffer[pos]
+                if ende:
+                    return None
+                nachladen()
+
+        def wert():
+            nonlocal pos
+            while True:
+                try:
+                    obj, neu = decoder.raw_decode(puffer, pos)
+                except json.JSONDecodeError:
+                    if ende:
+                        raise
+                    nachladen(); continue
+                if neu == len(puffer) and not ende:
+                    nachladen(); continue  # könnte mitten im Wert abgeschnitten sein
+                pos = neu
+                return obj
+
+        z = zeichen()
+        if z is None:
+            return  # leere Datei, wie sie ein Absturz beim alten open("w") + json.dump hinterlässt: keine Kunden
+        if z != "{":
+            raise ValueError("Snapshot ist kein JSON-Objekt")
+        pos += 1
+        while True:
+            z = zeichen()
+            if z in ("}", None):
+                return
+            if z == ",":
+                pos += 1; continue
+            wert()  # Schlüssel (kunden_id), steht auch im Datensatz selbst
+            if zeichen() != ":":
+                raise ValueError("':' erwartet")
+            pos += 1; zeichen()
+            yield wert()
+
+    @staticmethod
+    def _kopf_lesen(f):
+        """(Generation, Position nach der Kopfzeile); ältere Journale ohne Kopfzeile haben Generation None."""
+        f.seek(0)
+        zeile = f.readline()
+        if zeile.startswith(b'{"op": "kopf"') and zeile.endswith(b"\n"):
+            return json.loads(zeile)["generation"], len(zeile)
+        f.seek(0)
+        return None, 0
+
+    @staticmethod
+    def _eintraege(f):
+        """Die vollständigen Einträge ab der aktuellen Position, jeweils mit der Position dahinter."""
+        pos = f.tell()
+        for zeile in f:
+            if not zeile.endswith(b"\n"):
+                return  # abgebrochener oder gerade laufender Schreibvorgang am Ende
+            try:
+                eintrag = json.loads(zeile)
+            except ValueError:
+                return
+            pos += len(zeile)
+            yield eintrag, pos
+
+    def _nachziehen(self, db, fremd=None):
+        """Wendet an, was andere Prozesse seit 'gelesen_bis' angehängt haben (nur unter der Dateisperre).
+
+        Einträge zu Kunden mit eigenen ungespeicherten Änderungen sammelt es stattdessen als
+        {ID: (Version, Daten oder None)} in 'fremd'. False, wenn das Journal inzwischen neu
+        begonnen wurde und alles neu eingelesen werden muss.
+        """
+        try:
+            f = open(self.journal, "r+b")
+        except FileNotFoundError:
+            return self.generation is None and self.gelesen_bis == 0
+        with f:
+            generation, kopf = self._kopf_lesen(f)
+            groesse = os.fstat(f.fileno()).st_size
+            if generation != self.generation or groesse < self.gelesen_bis:
+                return False
+            f.seek(max(self.gelesen_bis, kopf))
+            for eintrag, ende in self._eintraege(f):
+                k_id, daten = eintrag["ID"], eintrag.get("daten")
+                if fremd is not None and (k_id in db.geaendert or k_id in db.geloescht):
+                    fremd[k_id] = (daten.get("Version", 0) if daten else eintrag.get("Version", 0), daten)
+                else:
+                    db.uebernehmen(k_id, Kunde.from_dict(daten) if daten else None)
+                self.gelesen_bis = ende
+                self.eintraege += 1
+            if self.gelesen_bis < groesse:
+                # Rest eines abgebrochenen Schreibvorgangs: unter der Sperre schreibt sonst niemand
+                f.truncate(self.gelesen_bis)
+        return True
+
+    def _neu_einlesen(self, db, fremd):
+        """Nach einer fremden Kompaktierung alles neu einlesen, dabei unsere ungespeicherten Änderungen
+        behalten und abweichende gespeicherte Stände in 'fremd' sammeln (nur unter der Dateisperre)."""
+        eigene = {k_id: db.kunden.get(k_id) for k_id in db.geaendert | db.geloescht}
+        versionen = {k_id: db.basis_version(k_id) for k_id in eigene}
+        geaendert, geloescht, basis = set(db.geaendert), set(db.geloescht), dict(db.basis)
+        with db.massenimport():
+            db.leeren()
+            self._einlesen(db, _oeffnen(self.datei), _oeffnen(self.journal))
+            self._nachziehen(db)
+        db.geaendert, db.geloescht, db.basis = geaendert, geloescht, basis
+        for k_id, kunde in eigene.items():
+            ihre = db.kunden.get(k_id)
+            if (ihre.version if ihre else 0) != versionen[k_id]:
+                fremd[k_id] = (ihre.version if ihre else versionen[k_id], ihre.to_dict() if ihre else None)
+            db.uebernehmen(k_id, kunde)
+
+    def schreiben(self, db):
+        if not db.geaendert and not db.geloescht:
+            return
+        with self.sperre, _dateisperre(self.sperrdatei):
+            fremd = {}
+            if not self._nachziehen(db, fremd):
+                self._neu_einlesen(db, fremd)
+            zeilen = []
+            for k_id in db.geaendert | db.geloescht:
+                version = db.basis_version(k_id)
+                if k_id in fremd:
+                    version, ihre = fremd[k_id]
+                    if not self._konflikt_loesen(db, k_id, ihre):
+                        continue
+                kunde = db.kunden.get(k_id)
+                if kunde is None:
+                    zeilen.append(json.dumps({"op": "delete", "ID": k_id, "Version": version + 1}))
+                else:
+                    kunde.version = version + 1
+                    zeilen.append(json.dumps({"op": "upsert", "ID": k_id, "daten": kunde.to_dict()}))
+            if zeilen:
+                with open(self.journal, "ab") as f:
+                    f.write(("\n".join(zeilen) + "\n").encode("utf-8"))
+                    f.flush(); os.fsync(f.fileno())
+                    self.gelesen_bis = f.tell()
+                self.eintraege += len(zeilen)
+            self.bekannter_stand = self._stand()
+        db.gespeichert()
+        if self.eintraege >= max(self.KOMPAKTIEREN_AB, len(db.kunden) // 2):
+            self.kompaktieren(db)
+
+    def kompaktieren(self, db, hintergrund=True):
+        if self._kompaktierung and self._kompaktierung.is_alive():
+            return
+        if self.ladefehler:
+            return  # nur teilweise geladen: der Snapshot darf nicht durch den Rest ersetzt werden
+        with self.sperre:
+            daten = {k.kunden_id: k.to_dict() for k in list(db.kunden.values())}
+            stand = (self.generation, self.gelesen_bis)
+        if hintergrund:
+            self._kompaktierung = threading.Thread(target=self._snapshot_schreiben, args=(daten, stand), daemon=True)
+            self._kompaktierung.start()
+        else:
+            self._snapshot_schreiben(daten, stand)
+
+    def neu_schreiben(self, db):
+        """Schreibt einen vollständigen Snapshot und beginnt ein leeres Journal."""
+        if self.ladefehler:
+            raise RuntimeError(f"Snapshot wird nicht überschrieben: {self.ladefehler}")
+        with self.sperre, _dateisperre(self.sperrdatei):
+            daten = {k.kunden_id: k.to_dict() for k in list(db.kunden.values())}
+            _atomar_schreiben(self.datei, lambda f: json.dump(daten, f, indent=4))
+            self._journal_beginnen()
+            self.bekannter_stand = self._stand()
+        db.gespeichert()
+
+    def _snapshot_schreiben(self, daten, stand):
+        with messen("kompaktieren"):
+            tmp = _tmp_schreiben(self.datei, lambda f: json.dump(daten, f, indent=4))
+            generation, pos = stand
+            with self.sperre, _dateisperre(self.sperrdatei):
+                rest = None
+                if generation == self.generation:
+                    with _oeffnen(self.journal) or io.BytesIO() as f:
+                        if self._kopf_lesen(f)[0] == generation and f.seek(0, 2) >= pos:
+                            # Alles nach 'pos' kam nach dem Erfassen von 'daten' dazu und bleibt im Journal
+                            f.seek(pos); rest = f.read()
+                if rest is None:
+                    os.remove(tmp); return  # inzwischen hat ein anderer Prozess kompaktiert
+                os.replace(tmp, self.datei)
+                self._journal_beginnen(rest, self.gelesen_bis - pos)
+                self.bekannter_stand = self._stand()
+
+    def _journal_beginnen(self, rest=b"", davon_gelesen=0):
+        """Ersetzt das Journal durch eine neue Generation mit den Einträgen 'rest' (nur unter der Dateisperre)."""
+        self.generation = uuid.uuid4().hex
+        kopf = (json.dumps({"op": "kopf", "generation": self.generation}) + "\n").encode("utf-8")
+        _atomar_schreiben(self.journal, lambda f: f.write(kopf + rest), "wb")
+        self.gelesen_bis = len(kopf) + davon_gelesen
+        self.eintraege = rest.count(b"\n")
+
+def _tmp_schreiben(datei, schreiber, modus="w"):
+    # Eigener tmp-Name je Prozess und Thread, mehrere Schreiber können gleichzeitig arbeiten
+    tmp = f"{datei}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, modus, **({} if "b" in modus else {"encoding": "utf-8"})) as f:
+        schreiber(f)
+        f.flush(); os.fsync(f.fileno())
+    return tmp
+
+def _atomar_schreiben(datei, schreiber, modus="w"):
+    os.replace(_tmp_schreiben(datei, schreiber, modus), datei)
+
+def _oeffnen(pfad):
+    try:
+        return open(pfad, "rb")
+    except FileNotFoundError:
+        return None
+
+@contextmanager
+def _dateisperre(pfad):
+    """Exklusive Sperre über Prozessgrenzen hinweg (flock, unter Windows msvcrt.locking)."""
+    with open(pfad, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    f.seek(0); msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1); break
+                except OSError:
+                    pass  # LK_LOCK gibt nach 10 s auf
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0); msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class SqliteSpeicher(Speicher):
+    """SQLite-Backend: Tabelle 'kunden' plus normalisierte Tabelle 'termine' mit Indizes.
+
+    Die Indizes dienen Abfragen direkt auf der Datei, die App selbst sucht über die
+    In-Memory-Indizes der Datenbank. Gespeichert wird in einer BEGIN-IMMEDIATE-Transaktion;
+    weicht die Version eines Kunden in der Datei von der ab, auf der unsere Änderung aufbaut,
+    wird wie beim Journal mit zusammenfuehren() vereinigt.
+
+    Jeder Schreibvorgang trägt die betroffenen IDs in die Tabelle 'aenderungen' ein (kunden_id NULL =
+    alles neu geschrieben). Andere Prozesse lesen beim Nachziehen nur die Kunden, die dort seit ihrer
+    letzten gelesenen Nummer stehen; fehlt ein Stück des Protokolls, wird komplett neu geladen.
+    """
+    AENDERUNGEN_BEHALTEN = 100_000  # so viele Protokolleinträge bleiben für nachziehende Prozesse stehen
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS kunden (
+            id TEXT PRIMARY KEY, anrede TEXT, vorname TEXT, nachname TEXT, geschlecht TEXT,
+            alter_jahre INTEGER, email TEXT, plz TEXT, telefon TEXT, mobil TEXT, wohnorte TEXT,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS termine (
+            kunden_id TEXT NOT NULL, pos INTEGER NOT NULL, zeitpunkt TEXT, notiz TEXT, text TEXT NOT NULL, dauer INTEGER,
+            PRIMARY KEY (kunden_id, pos)
+        );
+        CREATE INDEX IF NOT EXISTS idx_kunden_nachname ON kunden(nachname COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_kunden_plz ON kunden(plz);
+        CREATE INDEX IF NOT EXISTS idx_kunden_telefon ON kunden(telefon);
+        CREATE INDEX IF NOT EXISTS idx_kunden_mobil ON kunden(mobil);
+        CREATE INDEX IF NOT EXISTS idx_kunden_email ON kunden(email COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_termine_zeitpunkt ON termine(zeitpunkt);
+        CREATE TABLE IF NOT EXISTS aenderungen (nr INTEGER PRIMARY KEY AUTOINCREMENT, kunden_id TEXT);
+    """
+    SPALTEN = "id, anrede, vorname, nachname, geschlecht, alter_jahre, email, plz, telefon, mobil, wohnorte, version"
+    # Spalten, die später dazukamen und in bestehenden Dateien nachgetragen werden
+    NACHTRAEGE = (("kunden", "version", "INTEGER NOT NULL DEFAULT 0"), ("termine", "dauer", "INTEGER"))
+
+    def __init__(self, datei):
+        super().__init__(datei)
+        self.sperre = threading.Lock()
+        self.gelesen_bis = 0  # bis zu dieser Nummer in 'aenderungen' ist alles in unsere Datenbank eingeflossen
+        # Streamlit führt Sessions in verschiedenen Threads aus, der Zugriff läuft über self.sperre
+        self.verbindung = sqlite3.connect(datei, check_same_thread=False)
+        with self.verbindung:
+            self.verbindung.execute("PRAGMA journal_mode=WAL")
+            self.verbindung.executescript(self.SCHEMA)
+            for tabelle, spalte, typ in self.NACHTRAEGE:
+                if spalte not in {info[1] for info in self.verbindung.execute(f"PRAGMA table_info({tabelle})")}:
+                    self.verbindung.execute(f"ALTER TABLE {tabelle} ADD COLUMN {spalte} {typ}")
+
+    @staticmethod
+    def _termin(zeitpunkt, notiz, text, dauer):
+        return Termin(datetime.fromisoformat(zeitpunkt), notiz, text=text, dauer=dauer or TERMIN_DAUER) if zeitpunkt else Termin(None, text=text)
+
+    @staticmethod
+    def _kunde(zeile, termine):
+        k_id, anrede, vorname, nachname, geschlecht, alter, email, plz, telefon, mobil, wohnorte, version = zeile
+        return Kunde(anrede, vorname, nachname, geschlecht, alter, email, wohnorte.split(", ") if wohnorte else [],
+                     plz=plz, telefon=telefon, mobil=mobil, kunden_id=k_id, termine=termine, version=version)
+
+    def laden(self, db):
+        with self.sperre, self.verbindung, messen("laden"):
+            # Lesetransaktion: Protokollstand und Daten gehören zum selben Commit
+            self.verbindung.execute("BEGIN")
+            self.gelesen_bis = self._letzte_aenderung()
+            termine = {}
+            for k_id, *termin in self.verbindung.execute("SELECT kunden_id, zeitpunkt, notiz, text, dauer FROM termine ORDER BY kunden_id, pos"):
+                termine.setdefault(k_id, []).append(self._termin(*termin))
+            for zeile in self.verbindung.execute(f"SELECT {self.SPALTEN} FROM kunden ORDER BY rowid"):
+                db.hinzufuegen(self._kunde(zeile, termine.get(zeile[0], [])))
+            self._data_version = self._datenversion()
+        zaehlen("laden.kunden", len(db.kunden))
+        db.gespeichert()
+
+    def _kunde_lesen(self, k_id):
+        """Der gespeicherte Stand eines Kunden als Dict wie Kunde.to_dict(), None wenn es ihn nicht gibt."""
+        zeile = self.verbindung.execute(f"SELECT {self.SPALTEN} FROM kunden WHERE id = ?", (k_id,)).fetchone()
+        if zeile is None:
+            return None
+        termine = [self._termin(*t) for t in self.verbindung.execute("SELECT zeitpunkt, notiz, text, dauer FROM termine WHERE kunden_id = ? ORDER BY pos", (k_id,))]
+        return self._kunde(zeile, termine).to_dict()
+
+    def _letzte_aenderung(self):
+        zeile = self.verbindung.execute("SELECT seq FROM sqlite_sequence WHERE name = 'aenderungen'").fetchone()
+        return zeile[0] if zeile else 0
+
+    def _datenversion(self):
+        # Ändert sich nur durch Commits anderer Verbindungen, nicht durch unsere eigenen
+        return self.verbindung.execute("PRAGMA data_version").fetchone()[0]
+
+    def extern_geaendert(self):
+        with self.sperre:
+            return self._datenversion() != self._data_version
+
+    def aktualisieren(self, db):
+        """Zieht die seit 'gelesen_bis' protokollierten Kunden nach; Kunden mit eigenen ungespeicherten
+        Änderungen bleiben stehen, die vereinigt schreiben() über den Versionsvergleich."""
+        ihre = {}
+        with self.sperre, self.verbindung, messen("nachziehen"):
+            self.verbindung.execute("BEGIN")
+            zeilen = self.verbindung.execute("SELECT nr, kunden_id FROM aenderungen WHERE nr > ? ORDER BY nr", (self.gelesen_bis,)).fetchall()
+            erste = self.verbindung.execute("SELECT MIN(nr) FROM aenderungen").fetchone()[0]
+            komplett = zeilen and (erste > self.gelesen_bis + 1 or any(k_id is None for _, k_id in zeilen))
+            if zeilen and not komplett:
+                eigene = db.geaendert | db.geloescht
+                ihre = {k_id: self._kunde_lesen(k_id) for _, k_id in zeilen if k_id not in eigene}
+                self.gelesen_bis = zeilen[-1][0]
+            self._data_version = self._datenversion()
+        if komplett:
+            db.neu_laden(); return
+        for k_id, daten in ihre.items():
+            unsere = db.kunden.get(k_id)
+            # Gleiche Version: kennen wir schon, z. B. von unserem eigenen Schreibvorgang
+            if (daten["Version"] if daten else None) != (unsere.version if unsere else None):
+                db.uebernehmen(k_id, Kunde.from_dict(daten) if daten else None)
+                zaehlen("nachziehen.kunden")
+        db.version += 1
+
+    def _kunde_schreiben(self, k):
+        self.verbindung.execute(
+            f"INSERT INTO kunden ({self.SPALTEN}) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET anrede=excluded.anrede, vorname=excluded.vorname, "
+            "nachname=excluded.nachname, geschlecht=excluded.geschlecht, alter_jahre=excluded.alter_jahre, email=excluded.email, "
+            "plz=excluded.plz, telefon=excluded.telefon, mobil=excluded.mobil, wohnorte=excluded.wohnorte, version=excluded.version",
+            (k.kunden_id, k.anrede, k.vorname, k.nachname, k.geschlecht, k.alter, k.email, k.plz, k.telefon, k.mobil, ", ".join(k.wohnorte), k.version))
+        self.verbindung.execute("DELETE FROM termine WHERE kunden_id = ?", (k.kunden_id,))
+        zeilen = []
+        for pos, t in enumerate(k.termine):
+            zeilen.append((k.kunden_id, pos, t.zeitpunkt.isoformat() if t.zeitpunkt else None, t.notiz if t.zeitpunkt else None, t.text, t.dauer if t.zeitpunkt else None))
+        self.verbindung.executemany("INSERT INTO termine (kunden_id, pos, zeitpunkt, notiz, text, dauer) VALUES (?, ?, ?, ?, ?, ?)", zeilen)
+
+    def _kunde_entfernen(self, k_id):
+        self.verbindung.execute("DELETE FROM kunden WHERE id = ?", (k_id,))
+        self.verbindung.execute("DELETE FROM termine WHERE kunden_id = ?", (k_id,))
+
+    def schreiben(self, db):
+        if not db.geaendert and not db.geloescht:
+            return
+        with self.sperre, self.verbindung:
+            # Schreibsperre sofort holen, damit zwischen Versionsvergleich und Schreiben kein anderer Prozess committet
+            self.verbindung.execute("BEGIN IMMEDIATE")
+            aktuell = self._letzte_aenderung() == self.gelesen_bis
+            geschrieben = []
+            for k_id in db.geaendert | db.geloescht:
+                version = db.basis_version(k_id)
+                zeile = self.verbindung.execute("SELECT version FROM kunden WHERE id = ?", (k_id,)).fetchone()
+                if (zeile[0] if zeile else 0) != version:
+                    version = zeile[0] if zeile else version
+                    if not self._konflikt_loesen(db, k_id, self._kunde_lesen(k_id)):
+                        continue
+                kunde = db.kunden.get(k_id)
+                if kunde is None:
+                    self._kunde_entfernen(k_id)
+                else:
+                    kunde.version = version + 1
+                    self._kunde_schreiben(kunde)
+                geschrieben.append((k_id,))
+            self._protokollieren(geschrieben, aktuell)
+        db.gespeichert()
+
+    def _protokollieren(self, ids, aktuell):
+        """Trägt die geschriebenen IDs in 'aenderungen' ein und kürzt das Protokoll (nur in der Schreibtransaktion)."""
+        self.verbindung.executemany("INSERT INTO aenderungen (kunden_id) VALUES (?)", ids)
+        letzte = self._letzte_aenderung()
+        if aktuell:
+            self.gelesen_bis = letzte  # unsere eigenen Einträge müssen wir nicht nachziehen
+        self.verbindung.execute("DELETE FROM aenderungen WHERE nr <= ?", (letzte - self.AENDERUNGEN_BEHALTEN,))
+
+    def neu_schreiben(self, db):
+        with self.sperre, self.verbindung:
+            self.verbindung.execute("BEGIN IMMEDIATE")
+            aktuell = self._letzte_aenderung() == self.gelesen_bis
+            self.verbindung.execute("DELETE FROM kunden")
+            self.verbindung.execute("DELETE FROM termine")
+            for k in list(db.kunden.values()):
+                self._kunde_schreiben(k)
+            self._protokollieren([(None,)], aktuell)
+        db.gespeichert()
+
+def speicher_fuer(datei):
+    if datei.endswith((".db", ".sqlite", ".sqlite3")):
+        return SqliteSpeicher(datei)
+    return JournalSpeicher(datei)
+
+def speichern(db, datei=None):
+    if datei is None:
+        datei = db.speicher.datei if db.speicher else DATEI
+    with db.sperre, messen("speichern"):
+        if db.speicher is None or db.speicher.datei != datei:
+            db.speicher = speicher_fuer(datei)
+            db.speicher.neu_schreiben(db)
+        else:
+            db.speicher.schreiben(db)
+        db.version += 1
+
+def laden(datei=None, hintergrund=False):
+    db = Datenbank()
+    db.speicher = speicher_fuer(datei or DATEI)
+    if hintergrund:
+        db.im_hintergrund_laden()
+    else:
+        with db.massenimport():
+            db.speicher.laden(db)
     return db
 
-# === 4. HAUPT-INTERFACE ===
+@st.cache_resource(show_spinner=False)
+def _geteilte_datenbank(datei):
+    return laden(datei, hintergrund=True)
+
+def datenbank_holen(datei=None):
+    """Die gemeinsame Datenbank dieses Serverprozesses, mit den Änderungen anderer Prozesse abgeglichen."""
+    db = _geteilte_datenbank(datei or DATEI)
+    if db.geladen.is_set() and db.speicher.extern_geaendert():
+        with db.sperre:
+            if db.speicher.extern_geaendert():
+                db.speicher.aktualisieren(db)
+    return db
+
+def migrieren(quelle="kunden.json", ziel="kunden.db"):
+    """Überträgt alle Kunden aus 'quelle' in 'ziel', z. B. von der JSON-Datei nach SQLite."""
+    db = laden(quelle)
+    speichern(db, ziel)
+    return len(db.kunden)
+
+# === 4. MASSENIMPORT & EXPORT ===
+IMPORT_SPALTEN = ["ID", "Anrede", "Vorname", "Nachname", "Geschlecht", "Alter", "E-Mail", "PLZ", "Telefon", "Mobil", "Wohnorte", "Termine"]
+
+class ImportBericht:
+    def __init__(self):
+        self.gelesen = 0
+        self.importiert = 0
+        self.abgelehnt = []  # (Zeilennummer ab 1, Fehlermeldungen)
+        self.doppelt = []  # (Zeilennummer ab 1, ID) von Zeilen, die eine spätere Zeile mit derselben ID ersetzt hat
+        self.sekunden = 0.0
+
+    @property
+    def zeilen_pro_sekunde(self):
+        return self.gelesen / self.sekunden if self.sekunden else 0.0
+
+    def __str__(self):
+        return (f"{self.gelesen} Zeilen gelesen, {self.importiert} übernommen, {len(self.abgelehnt)} abgelehnt, "
+                f"{len(self.doppelt)} doppelte IDs ersetzt "
+                f"in {self.sekunden:.2f} s ({self.zeilen_pro_sekunde:,.0f} Zeilen/s)")
+
+def _format_erkennen(pfad, format):
+    format = format or os.path.splitext(pfad)[1].lstrip(".").lower()
+    format = {"ndjson": "jsonl"}.get(format, format)
+    if format not in ("csv", "jsonl", "parquet"):
+        raise ValueError(f"Unbekanntes Format '{format}' (csv, jsonl oder parquet)")
+    if format == "parquet" and pq is None:
+        raise RuntimeError("Für Parquet wird pyarrow benötigt")
+    return format
+
+def _bloecke_lesen(pfad, format, batch_groesse):
+    if format == "csv":
+        yield from pd.read_csv(pfad, dtype=str, keep_default_na=False, chunksize=batch_groesse)
+    elif format == "jsonl":
+        yield from pd.read_json(pfad, lines=True, dtype=False, chunksize=batch_groesse)
+    else:
+        for batch in pq.ParquetFile(pfad).iter_batches(batch_size=batch_groesse):
+            yield batch.to_pandas()
+
+def _block_normalisieren(block):
+    block = block.reindex(columns=IMPORT_SPALTEN)
+    return block.astype(object).where(block.notna(), "").astype(str).apply(lambda spalte: spalte.str.strip() if spalte.name != "Termine" else spalte)
+
+def _bestehende_ergaenzen(db, block, spalten):
+    """Spalten, die die Datei nicht hat, für schon vorhandene IDs vom gespeicherten Kunden übernehmen,
+    statt sie zu leeren (z. B. die Termine bei einem CRM-Export ohne Terminspalte)."""
+    with db.sperre:
+        alt = [db.kunden[k_id].to_dict() for k_id in block["ID"].unique() if k_id in db.kunden]
+    if not alt:
+        return block
+    alt = _block_normalisieren(pd.DataFrame(alt)).set_index("ID")
+    vorhanden = block["ID"].isin(alt.index)
+    block = block.copy()
+    block.loc[vorhanden, spalten] = alt.loc[block.loc[vorhanden, "ID"], spalten].to_numpy()
+    return block
+
+def kunden_pruefen(block):
+    """Die Regeln aus kunde_pruefen() spaltenweise; liefert pro Zeile die Fehlermeldungen ("" = gültig)."""
+    leer = {spalte: block[spalte] == "" for spalte in IMPORT_SPALTEN}
+    alter = pd.to_numeric(block["Alter"].where(~leer["Alter"], "1"), errors="coerce")
+    regeln = [
+        (leer["Anrede"], "Anrede fehlt."),
+        (~leer["Anrede"] & ~block["Anrede"].isin(ANREDEN), "Ungültige Anrede."),
+        (leer["Geschlecht"], "Geschlecht fehlt."),
+        (~leer["Geschlecht"] & ~block["Geschlecht"].isin(GESCHLECHTER), "Ungültiges Geschlecht."),
+        (leer["Nachname"], "Nachname fehlt."),
+        (leer["Vorname"], "Vorname fehlt."),
+        (leer["PLZ"], "Postleitzahl fehlt."),
+        (leer["Wohnorte"], "Wohnort fehlt."),
+        (leer["Telefon"], "Telefon fehlt."),
+        (~leer["PLZ"] & ~block["PLZ"].str.isdigit(), "PLZ darf nur Zahlen enthalten."),
+        (~leer["Telefon"] & ~block["Telefon"].str.isdigit(), "Telefon darf nur Zahlen enthalten."),
+        (~leer["Mobil"] & ~block["Mobil"].str.isdigit(), "Mobil darf nur Zahlen enthalten."),
+        (~leer["E-Mail"] & ~block["E-Mail"].str.contains("@", regex=False), "Ungültige E-Mail Adresse (@ fehlt)."),
+        (~(alter.between(1, 120) & (alter % 1 == 0)), "Alter muss zwischen 1 und 120 liegen."),
+    ]
+    fehler = pd.Series("", index=block.index)
+    for maske, text in regeln:
+        fehler = fehler.mask(maske, fehler + text + " ")
+    return fehler.str.rstrip()
+
+def importieren(db, pfad, format=None, batch_groesse=10_000):
+    """Liest Kunden blockweise aus CSV, JSONL oder Parquet (Spalten wie Kunde.to_dict()).
+
+    Jeder Block wird mit kunden_pruefen() geprüft und mit einem einzigen speichern() übernommen,
+    bestehende IDs werden überschrieben; Spalten, die in der Datei fehlen, behalten dabei ihren
+    bisherigen Wert. Kommt eine ID in der Datei mehrfach vor, gilt die letzte Zeile.
+    Abgelehnte und ersetzte Zeilen stehen im Bericht.
+    """
+    format = _format_erkennen(pfad, format)
+    bericht = ImportBericht()
+    gesehen = {}  # ID -> Zeilennummer der zuletzt übernommenen Zeile
+    start = time.perf_counter()
+    for block in _bloecke_lesen(pfad, format, batch_groesse):
+        fehlend = [spalte for spalte in IMPORT_SPALTEN if spalte not in block.columns]
+        block = _block_normalisieren(block).reset_index(drop=True)
+        if fehlend and "ID" not in fehlend:
+            block = _bestehende_ergaenzen(db, block, fehlend)
+        fehler = kunden_pruefen(block)
+        gueltig = fehler == ""
+        bericht.abgelehnt.extend((bericht.gelesen + i + 1, text) for i, text in fehler[~gueltig].items())
+        zeilen = block[gueltig]
+        zeilen = zeilen.assign(Alter=pd.to_numeric(zeilen["Alter"].where(zeilen["Alter"] != "", "1")).astype(int),
+                               ID=zeilen["ID"].where(zeilen["ID"] != "", None))
+        ids = zeilen["ID"]
+        doppelt = ids.notna() & ids.duplicated(keep="last")
+        bericht.doppelt.extend((bericht.gelesen + i + 1, k_id) for i, k_id in ids[doppelt].items())
+        zeilen = zeilen[~doppelt]
+        ersetzt = 0
+        for i, k_id in zeilen["ID"].dropna().items():
+            if k_id in gesehen:
+                bericht.doppelt.append((gesehen[k_id], k_id)); ersetzt += 1
+            gesehen[k_id] = bericht.gelesen + i + 1
+        kunden = [Kunde.from_dict(daten) for daten in zeilen.to_dict("records")]
+        with db.sperre:
+            db.hinzufuegen_viele(kunden)
+            speichern(db)
+        bericht.gelesen += len(block)
+        bericht.importiert += len(kunden) - ersetzt
+    bericht.sekunden = time.perf_counter() - start
+    return bericht
+
+def exportieren(db, pfad, format=None, batch_groesse=10_000):
+    """Schreibt alle Kunden blockweise im Schema von Kunde.to_dict() nach CSV, JSONL oder Parquet."""
+    format = _format_erkennen(pfad, format)
+    bericht = ImportBericht()
+    start = time.perf_counter()
+    with db.sperre:
+        kunden = list(db.kunden.values())
+    f = open(pfad, "w", encoding="utf-8", newline="") if format != "parquet" else None
+    schreiber = None
+    try:
+        for i in range(0, len(kunden), batch_groesse):
+            zeilen = [k.to_dict() for k in kunden[i:i + batch_groesse]]
+            if format == "csv":
+                pd.DataFrame(zeilen, columns=IMPORT_SPALTEN).to_csv(f, index=False, header=(i == 0))
+            elif format == "jsonl":
+                f.writelines(json.dumps(z, ensure_ascii=False) + "\n" for z in zeilen)
+            else:
+                tabelle = pa.Table.from_pandas(pd.DataFrame(zeilen, columns=IMPORT_SPALTEN).astype(str), preserve_index=False)
+                schreiber = schreiber or pq.ParquetWriter(pfad, tabelle.schema)
+                schreiber.write_table(tabelle)
+            bericht.gelesen += len(zeilen)
+    finally:
+        if f: f.close()
+        if schreiber: schreiber.close()
+    bericht.importiert = bericht.gelesen
+    bericht.sekunden = time.perf_counter() - start
+    return bericht
+
+def kommandozeile(argumente=None):
+    """python KVS.py import|export DATEI [--format ...] [--batch N] [--datenbank kunden.json]"""
+    import argparse
+    parser = argparse.ArgumentParser(prog="KVS.py", description="Massenimport/-export für die KVS-Kundendaten")
+    parser.add_argument("aktion", choices=["import", "export"])
+    parser.add_argument("datei")
+    parser.add_argument("--format", choices=["csv", "jsonl", "parquet"])
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--datenbank", default=DATEI)
+    args = parser.parse_args(argumente)
+    db = laden(args.datenbank)
+    if args.aktion == "import":
+        bericht = importieren(db, args.datei, args.format, args.batch)
+        for zeile, text in bericht.abgelehnt[:20]:
+            print(f"Zeile {zeile}: {text}")
+        if len(bericht.abgelehnt) > 20:
+            print(f"... und {len(bericht.abgelehnt) - 20} weitere abgelehnte Zeilen")
+        for zeile, k_id in bericht.doppelt[:20]:
+            print(f"Zeile {zeile}: ID {k_id} kommt später noch einmal vor und wurde ersetzt")
+    else:
+        bericht = exportieren(db, args.datei, args.format, args.batch)
+    print(bericht)
+    if MESSWERTE.aktiv:
+        print(MESSWERTE.prometheus(), file=sys.stderr, end="")
+
+# === 5. HAUPT-INTERFACE ===
+SEITENGROESSEN = [10, 25, 50, 100, 250]
+AUSWAHL_MAX = 100  # Optionen, die eine Auswahlliste höchstens an den Browser schickt
+
+def melden(text, icon="✅"):
+    """Merkt eine Erfolgsmeldung für den nächsten Lauf vor, st.rerun() verwirft alles bisher Angezeigte."""
+    st.session_state.setdefault("meldungen", []).append((text, icon))
+
+def ueberschneidungen_anzeigen(db, konflikte):
+    zeilen = [f"- {t.zeitpunkt:%d.%m.%Y %H:%M}–{t.ende:%H:%M}: {k.nachname}, {k.vorname}" for t in konflikte if (k := db.kunden.get(t.kunden_id))]
+    st.error("⚠️ Der Termin überschneidet sich mit:\n" + "\n".join(zeilen))
+
+def termin_finden(kunde, text):
+    """Position des Termins mit diesem Text, None wenn ihn inzwischen (z. B. eine andere Session) geändert oder gelöscht hat."""
+    return next((i for i, t in enumerate(kunde.termine) if t.text == text), None) if kunde else None
+
+def slot_uebernehmen(slot, dauer):
+    # on_click läuft vor dem nächsten Lauf, also bevor das Buchungsformular seine Felder anlegt
+    st.session_state.book_datum = slot.date(); st.session_state.book_zeit = slot.time(); st.session_state.book_dauer = dauer
+
+def auswahl_begrenzen(treffer):
+    """Die ersten AUSWAHL_MAX Treffer als Optionen einer Auswahlliste, bei mehr ein Hinweis statt aller."""
+    if len(treffer) > AUSWAHL_MAX:
+        st.caption(f"{len(treffer)} Treffer, zur Auswahl stehen die ersten {AUSWAHL_MAX}. Bitte Suche verfeinern.")
+    return treffer[:AUSWAHL_MAX]
+
+def seitenfenster(anzahl, key, standard=25):
+    """Seitengröße- und Seitenauswahl; liefert (start, ende) des sichtbaren Ausschnitts."""
+    c1, c2 = st.columns(2)
+    groesse = c1.selectbox("Einträge pro Seite", SEITENGROESSEN, index=SEITENGROESSEN.index(standard), key=f"{key}_groesse")
+    seiten = max(1, -(-anzahl // groesse))
+    if st.session_state.get(f"{key}_seite", 1) > seiten:
+        st.session_state[f"{key}_seite"] = seiten  # z. B. nach einer engeren Suche
+    seite = c2.number_input(f"Seite (von {seiten})", 1, seiten, key=f"{key}_seite")
+    start = (seite - 1) * groesse
+    return start, min(start + groesse, anzahl)
+
+def _sortierbar(spalte):
+    # Altdaten mischen im Alter Zahlen und Texte ("41" neben 41), die sort_values() nicht vergleichen kann:
+    # numerisch sortieren, Nicht-Zahlen ans Ende; ohne eine einzige Zahl als Text
+    if spalte.dtype != object:
+        return spalte
+    zahlen = pd.to_numeric(spalte, errors="coerce")
+    return zahlen if zahlen.notna().any() else spalte.astype(str)
+
+def tabelle_seitenweise(df, spalten, key, sortierschluessel=None):
+    """st.dataframe mit Sortierung und Seitenweise-Anzeige: nur die sichtbare Seite geht an den Browser."""
+    sortierschluessel = sortierschluessel or {}
+    c1, c2 = st.columns([3, 1])
+    sortierung = c1.selectbox("Sortieren nach", ["(Standard)"] + spalten, key=f"{key}_sortierung")
+    absteigend = c2.toggle("absteigend", key=f"{key}_absteigend")
+    if sortierung != "(Standard)":
+        df = df.sort_values(sortierschluessel.get(sortierung, sortierung), ascending=not absteigend, kind="stable", key=_sortierbar)
+    elif absteigend:
+        df = df.iloc[::-1]
+    start, ende = seitenfenster(len(df), key)
+    with messen("tabelle.anzeigen"):
+        st.dataframe(df.iloc[start:ende][spalten], use_container_width=True, hide_index=True)
+    st.caption(f"Zeige {start + 1 if ende else 0}–{ende} von {len(df)}")
+
+def kennzahlen_anzeigen(kz, status):
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Gesamt-Kunden", kz["kunden"])
+    c2.metric("Ø-Alter", f"{kz['alter_schnitt']:.1f} J." if kz["alter_schnitt"] else "0 J.")
+    c3.metric("Status", status)
+    c4, c5, c6 = st.columns(3)
+    c4.metric("Termine heute", kz["termine_heute"])
+    c5.metric("Termine diese Woche", kz["termine_woche"])
+    c6.metric("Termine (7 Tage)", kz["termine_7_tage"])
+
+@st.fragment(run_every=1)
+def ladestatus(db):
+    if db.geladen.is_set():
+        st.rerun()
+    # Die Kennzahlen wachsen beim Laden mit, die Kopfwerte brauchen dafür keine Sperre
+    # "Termine (7 Tage)" braucht den Terminindex, der erst am Ende des Ladens aufgebaut wird
+    kennzahlen_anzeigen({**db.kennzahlen.kopfwerte(datetime.now()), "termine_7_tage": "…"}, "Lädt …")
+    st.progress(db.speicher.fortschritt, text="Kundendaten werden geladen …")
+
+def messwerte_umschalten():
+    MESSWERTE.aktiv = st.session_state.profiling
+
+def admin_sichtbar():
+    if ADMIN in ("", "0"):
+        return False
+    return ADMIN == "1" or st.query_params.get("admin") == ADMIN
+
+def messwerte_anzeigen(lauf):
+    """Admin-Bereich der Sidebar: Zeitleiste des letzten Durchlaufs, Summen seit Start und Export."""
+    with st.sidebar.expander("🛠️ Admin: Messwerte"):
+        st.session_state.profiling = MESSWERTE.aktiv  # eine andere Session kann umgeschaltet haben
+        st.toggle("Messung aktiv (alle Sessions)", key="profiling", on_change=messwerte_umschalten)
+        if not MESSWERTE.aktiv:
+            st.caption("Aus: die Messpunkte kosten praktisch nichts. Start mit KVS_PROFILING=1 schaltet sie von Anfang an ein.")
+            return
+        if lauf:
+            st.markdown("**Dieser Durchlauf**")
+            st.dataframe(pd.DataFrame([{"Abschnitt": n, "Anzahl": a, "ms": round(d * 1e3, 2)} for n, (a, d) in lauf.items()]),
+                         use_container_width=True, hide_index=True)
+        daten = MESSWERTE.als_json()
+        if daten["spans"]:
+            st.markdown("**Seit Start**")
+            st.dataframe(pd.DataFrame([{"Abschnitt": n, "Anzahl": w["anzahl"], "Summe ms": round(w["summe_s"] * 1e3, 1),
+                                        "Mittel ms": round(w["summe_s"] / w["anzahl"] * 1e3, 2), "Max ms": round(w["max_s"] * 1e3, 2)}
+                                       for n, w in daten["spans"].items()]), use_container_width=True, hide_index=True)
+        if daten["zaehler"]:
+            st.dataframe(pd.DataFrame([{"Zähler": n, "Wert": w} for n, w in daten["zaehler"].items()]), use_container_width=True, hide_index=True)
+        c1, c2 = st.columns(2)
+        c1.download_button("Prometheus", MESSWERTE.prometheus(), "kvs_messwerte.prom", "text/plain", use_container_width=True)
+        c2.download_button("JSON", json.dumps(daten, indent=2), "kvs_messwerte.json", "application/json", use_container_width=True)
+        if st.button("Zurücksetzen", use_container_width=True):
+            MESSWERTE.zuruecksetzen(); st.rerun()
+
 def main():
-    if 'db' not in st.session_state:
-        st.session_state.db = laden()
-    db = st.session_state.db
+    MESSWERTE.lauf_beginnen()
+    try:
+        with messen("lauf"):
+            seite()
+    finally:
+        lauf = MESSWERTE.lauf_beenden()
+    if admin_sichtbar():
+        messwerte_anzeigen(lauf)
+
+def seite():
+    db = datenbank_holen()
+    for text, icon in st.session_state.pop("meldungen", []):
+        st.toast(text, icon=icon)
+    if st.session_state.get('db_version') != db.version:
+        # Daten wurden (evtl. von einer anderen Session) geändert -> verwaiste Auswahl verwerfen
+        st.session_state.db_version = db.version
+        if st.session_state.get('edit_id') and st.session_state.edit_id not in db.kunden:
+            st.session_state.edit_id = None
 
     if 'page' not in st.session_state: st.session_state.page = "Startseite"
     if 'edit_id' not in st.session_state: st.session_state.edit_id = None
-    if 'edit_term_idx' not in st.session_state: st.session_state.edit_term_idx = None
+    if 'edit_termin' not in st.session_state: st.session_state.edit_termin = None
     if 'delete_confirm' not in st.session_state: st.session_state.delete_confirm = False
     if 'reset_stamm_search' not in st.session_state: st.session_state.reset_stamm_search = False
     if 'reset_overview_search' not in st.session_state: st.session_state.reset_overview_search = False
@@ -128,14 +1831,19 @@ def main():
     st.sidebar.markdown("---")
     st.sidebar.write(f"Kunden im System: **{len(db.kunden)}**")
 
+    if not db.geladen.is_set():
+        st.title("🏠 KVS KundenVerwaltungsSystem")
+        ladestatus(db)
+        return
+    if db.speicher.ladefehler:
+        st.error(f"⚠️ {db.speicher.ladefehler}. Die Daten sind unvollständig, bitte die Datei prüfen.")
+
     # --- STARTSEITE ---
     if st.session_state.page == "Startseite":
         st.title("🏠 KVS KundenVerwaltungsSystem")
-        c1, c2, c3 = st.columns(3)
-        c1.metric("Gesamt-Kunden", len(db.kunden))
-        alts = [int(k.alter) for k in db.kunden.values() if str(k.alter).isdigit() and int(k.alter) > 0]
-        c2.metric("Ø-Alter", f"{sum(alts)/len(alts):.1f} J." if alts else "0 J.")
-        c3.metric("Status", "Online")
+        heute = datetime.now()
+        kz = db.kennzahlen_uebersicht(heute)
+        kennzahlen_anzeigen(kz, "Online")
         st.markdown("---")
         
         st.subheader("💡 Schnellzugriff")
@@ -147,40 +1855,40 @@ def main():
         
         st.markdown("---")
         
-        heute = datetime.now()
-        alle_termine = []
-        for k in db.kunden.values():
-            for idx, t_str in enumerate(k.termine):
-                try:
-                    p = t_str.split(" um "); d_dt = datetime.strptime(p[0], '%d.%m.%Y')
-                    p2 = p[1].split(" - "); t_dt = datetime.strptime(p2[0], '%H:%M').time()
-                    full_dt = datetime.combine(d_dt.date(), t_dt)
-                    if full_dt >= heute:
-                        alle_termine.append({"dt": full_dt, "kunde": k, "note": p2[1] if len(p2)>1 else ""})
-                except: pass
-        alle_termine.sort(key=lambda x: x['dt'])
+        nt = db.naechster_termin(heute)
 
         st.subheader("📌 Nächster Termin")
-        if alle_termine:
-            nt = alle_termine[0]; kn = nt['kunde']
+        kn = db.kunden.get(nt.kunden_id) if nt else None
+        if kn:
             st.markdown(f"""
             <div class="focus-card">
-                <h2 style="color: #bb86fc; margin-top:0;">📅 {nt['dt'].strftime('%d.%m.%Y um %H:%M Uhr')}</h2>
+                <h2 style="color: #bb86fc; margin-top:0;">📅 {nt.zeitpunkt.strftime('%d.%m.%Y um %H:%M Uhr')}</h2>
                 <p style="font-size: 1.4rem; margin-bottom:10px;"><b>{kn.anrede} {kn.vorname} {kn.nachname}</b></p>
                 <p style="font-size: 1.1rem;">📞 <b>Telefon:</b> {kn.telefon} | 📱 <b>Mobil:</b> {kn.mobil}</p>
-                <p style="font-size: 1.1rem; background: #1d2129; padding: 10px; border-radius: 5px;">📝 <b>Notiz:</b> {nt['note']}</p>
+                <p style="font-size: 1.1rem; background: #1d2129; padding: 10px; border-radius: 5px;">📝 <b>Notiz:</b> {nt.notiz}</p>
             </div>
             """, unsafe_allow_html=True)
         
         st.markdown("---")
         st.subheader("🔔 Kommende Termine (7 Tage)")
-        bevor_7 = [t for t in alle_termine if t['dt'] <= heute + timedelta(days=7)]
+        bevor_7 = [(t, db.kunden.get(t.kunden_id)) for t in db.termine_zwischen(heute, heute + timedelta(days=7))]
+        bevor_7 = [(t, k) for t, k in bevor_7 if k]
         if bevor_7:
-            for it in bevor_7:
-                k = it['kunde']
-                st.markdown(f'<div class="reminder-card">📅 {it["dt"].strftime("%d.%m.%Y | %H:%M")} | <b>{k.nachname}</b> (Tel: {k.telefon})<br>{it["note"]}</div>', unsafe_allow_html=True)
+            start, ende = seitenfenster(len(bevor_7), "erinnerungen", standard=10)
+            for t, k in bevor_7[start:ende]:
+                st.markdown(f'<div class="reminder-card">📅 {t.zeitpunkt.strftime("%d.%m.%Y | %H:%M")}–{t.ende.strftime("%H:%M")} | <b>{k.nachname}</b> (Tel: {k.telefon})<br>{t.notiz}</div>', unsafe_allow_html=True)
         else: st.info("Keine weiteren Termine.")
 
+        st.markdown("---")
+        st.subheader("📊 Kennzahlen")
+        g1, g2, g3 = st.columns(3)
+        g1.caption("Altersgruppen")
+        g1.bar_chart(pd.Series({f"{a}–{a + 9}": n for a, n in kz["altersgruppen"].items()}, name="Kunden"))
+        g2.caption("Kunden nach PLZ-Region")
+        g2.bar_chart(pd.Series({f"{r}xxxx": n for r, n in kz["plz_regionen"].items()}, name="Kunden"))
+        g3.caption("Termine pro Woche")
+        g3.bar_chart(pd.Series({f"KW {w.isocalendar()[1]:02d}": n for w, n in kz["termine_pro_woche"].items()}, name="Termine"))
+
     # --- TERMINE ---
     elif st.session_state.page == "Termine":
         st.title("📅 Terminverwaltung")
@@ -196,10 +1904,10 @@ def main():
             search_t = st.text_input("🔍 Kunde suchen", key="term_book_search")
             sel_k_id = None
             if search_t:
-                hits = [k for k in db.kunden.values() if any(search_t.lower() in str(v).lower() for v in [k.vorname, k.nachname, k.kunden_id])]
+                hits = db.suchen(search_t, BUCHUNG_SUCHFELDER)
                 if hits:
                     sel_k = st.selectbox(
-                        "Kunde wählen", hits, index=None,
+                        "Kunde wählen", auswahl_begrenzen(hits), index=None,
                         placeholder="Bitte Kunden auswählen...",
                         format_func=lambda x: f"{x.nachname}, {x.vorname} ({x.kunden_id})",
                         key="book_select"
@@ -210,24 +1918,48 @@ def main():
                             st.session_state.reset_book_search = True
                             st.rerun()
 
+            with st.expander("🕒 Freie Slots finden"):
+                f1, f2, f3, f4 = st.columns(4)
+                slot_von = f1.date_input("Von", datetime.now(), key="slot_von")
+                slot_bis = f2.date_input("Bis", datetime.now() + timedelta(days=14), key="slot_bis")
+                slot_dauer = f3.number_input("Dauer (Min.)", DAUER_MIN, DAUER_MAX, TERMIN_DAUER, step=5, key="slot_dauer")
+                slot_anzahl = f4.number_input("Anzahl", 1, 50, 5, key="slot_anzahl")
+                slots = db.freie_slots(max(datetime.now(), datetime.combine(slot_von, datetime.min.time())),
+                                       datetime.combine(slot_bis + timedelta(days=1), datetime.min.time()), int(slot_dauer), int(slot_anzahl))
+                if not slots:
+                    st.info(f"Keine freien Slots in den Öffnungszeiten ({OEFFNUNGSZEITEN[0]}–{OEFFNUNGSZEITEN[1]} Uhr, Mo–Fr).")
+                for i, slot in enumerate(slots):
+                    s1, s2 = st.columns([3, 1])
+                    s1.write(f"{'MoDiMiDoFrSaSo'[2 * slot.weekday():2 * slot.weekday() + 2]} {slot:%d.%m.%Y %H:%M}–{slot + timedelta(minutes=int(slot_dauer)):%H:%M}")
+                    s2.button("Übernehmen", key=f"slot_{i}", on_click=slot_uebernehmen, args=(slot, int(slot_dauer)))
+
+            st.session_state.setdefault("book_datum", datetime.now().date())
+            st.session_state.setdefault("book_zeit", datetime.now().time().replace(second=0, microsecond=0))
+            st.session_state.setdefault("book_dauer", TERMIN_DAUER)
             with st.form("term_form_new"):
-                c1, c2 = st.columns(2)
-                d = c1.date_input("Datum", datetime.now())
-                t = c2.time_input("Uhrzeit", datetime.now().time())
+                c1, c2, c3 = st.columns(3)
+                d = c1.date_input("Datum", key="book_datum")
+                t = c2.time_input("Uhrzeit", key="book_zeit")
+                dauer = c3.number_input("Dauer (Min.)", DAUER_MIN, DAUER_MAX, step=5, key="book_dauer")
                 ctel, cmob = st.columns(2)
                 t_val = ctel.text_input("Telefon", value=db.kunden[sel_k_id].telefon if sel_k_id else "")
                 m_val = cmob.text_input("Mobil", value=db.kunden[sel_k_id].mobil if sel_k_id else "")
                 note = st.text_input("Notiz")
                 
                 if st.form_submit_button("Termin speichern"):
-                    if sel_k_id:
-                        kunde_obj = db.kunden[sel_k_id]  # Sichere Referenz aus der Datenbank
-                        kunde_obj.telefon, kunde_obj.mobil = t_val, m_val
-                        kunde_obj.termine.append(f"{d.strftime('%d.%m.%Y')} um {t.strftime('%H:%M')} - {note}")
-                        speichern(db)
-                        st.success("✅ Termin gebucht!")
-                        time.sleep(1)
-                        st.rerun()
+                    if sel_k_id and sel_k_id in db.kunden:
+                        neuer_termin = Termin(datetime.combine(d, t.replace(second=0, microsecond=0)), note, dauer=int(dauer))
+                        with db.sperre:
+                            konflikte = db.ueberschneidungen(neuer_termin.zeitpunkt, neuer_termin.ende)
+                            if not konflikte:
+                                kunde_obj = db.kunden[sel_k_id]  # Sichere Referenz aus der Datenbank
+                                db.bearbeiten(sel_k_id, telefon=t_val, mobil=m_val, termine=kunde_obj.termine + [neuer_termin])
+                                speichern(db)
+                        if konflikte:
+                            ueberschneidungen_anzeigen(db, konflikte)
+                        else:
+                            melden("Termin gebucht!")
+                            st.rerun()
                     else:
                         st.error("⚠️ Bitte Kunden wählen!")
 
@@ -238,44 +1970,61 @@ def main():
                 st.session_state.reset_overview_search = False; st.session_state.term_overview_search = ""; st.rerun()
 
             term_suche = st.text_input("Suche", key="term_overview_search")
-            all_terms_list = []
-            for k in db.kunden.values():
-                for idx, t_str in enumerate(k.termine):
-                    try:
-                        p = t_str.split(" um "); d_dt = datetime.strptime(p[0], '%d.%m.%Y')
-                        p2 = p[1].split(" - "); t_dt = datetime.strptime(p2[0], '%H:%M').time()
-                        item = {"ID": k.kunden_id, "Anrede": k.anrede, "Vorname": k.vorname, "Nachname": k.nachname, "Wohnort": ", ".join(k.wohnorte), "PLZ": k.plz, "Telefon": k.telefon, "Mobil": k.mobil, "Datum": d_dt.strftime('%d.%m.%Y'), "Uhrzeit": t_dt.strftime('%H:%M'), "Notiz": p2[1] if len(p2)>1 else "", "idx": idx, "sort": datetime.combine(d_dt.date(), t_dt)}
-                        
-                        search_fields = [item['Vorname'], item['Nachname'], item['ID'], item['Wohnort'], item['PLZ'], item['Telefon'], item['Mobil']]
-                        if not term_suche or any(term_suche.lower() in str(val).lower() for val in search_fields):
-                            all_terms_list.append(item)
-                    except: pass
-            all_terms_list.sort(key=lambda x: x['sort'])
-
-            if term_suche and all_terms_list:
-                sel_item = st.selectbox("Auswahl zur Bearbeitung:", all_terms_list, index=None, placeholder="Termin wählen...", format_func=lambda x: f"{x['Nachname']}: {x['Datum']} {x['Uhrzeit']}", key="term_select_persist")
-                if sel_item:
+            treffer_ids = [k.kunden_id for k in db.suchen(term_suche, TERMIN_SUCHFELDER)] if term_suche else None
+            df_termine = db.termin_tabelle(treffer_ids)
+            if db.termin_index.unlesbar:
+                st.caption(f"⚠️ {db.termin_index.unlesbar} Termin(e) mit unlesbarem Datum werden nicht angezeigt.")
+
+            if term_suche and not df_termine.empty:
+                # Optionen sind Zeilennummern in df_termine; ändern sich Suche oder Daten, gilt die alte Auswahl nicht mehr
+                if st.session_state.get("term_select_stand") != (term_suche, db.version):
+                    st.session_state.term_select_stand = (term_suche, db.version); st.session_state.term_select_persist = None
+                zeile = st.selectbox("Auswahl zur Bearbeitung:", auswahl_begrenzen(range(len(df_termine))), index=None, placeholder="Termin wählen...", format_func=lambda i: f"{df_termine['Nachname'].iat[i]}: {df_termine['Datum'].iat[i]} {df_termine['Uhrzeit'].iat[i]}", key="term_select_persist")
+                sel_item = df_termine.iloc[zeile] if zeile is not None else None
+                if sel_item is not None:
                     c_b1, c_b2 = st.columns(2)
                     if c_b1.button("✏️ Bearbeiten"):
-                        st.session_state.edit_id = sel_item['ID']; st.session_state.edit_term_idx = sel_item['idx']; st.rerun()
+                        # Den Termin über seinen Text merken, seine Position kann sich durch andere Sessions verschieben
+                        k = db.kunden.get(sel_item['ID']); idx = int(sel_item['idx'])
+                        termin = k.termine[idx] if k and idx < len(k.termine) and k.termine[idx].zeitpunkt == sel_item['sort'] else None
+                        st.session_state.edit_id = sel_item['ID']; st.session_state.edit_termin = termin.text if termin else ""; st.rerun()
                     if c_b2.button("❌ Schließen"):
                         st.session_state.edit_id = None; st.session_state.reset_overview_search = True; st.rerun()
 
-            if st.session_state.edit_id and st.session_state.edit_term_idx is not None:
+            if st.session_state.edit_id and st.session_state.edit_termin is not None:
                 curr_k = db.kunden.get(st.session_state.edit_id)
-                if curr_k:
+                if termin_finden(curr_k, st.session_state.edit_termin) is None:
+                    st.error("⚠️ Der Termin wurde inzwischen geändert oder gelöscht. Bitte neu auswählen.")
+                    st.session_state.edit_termin = None; st.session_state.delete_confirm = False
+                else:
+                    alter_termin = curr_k.termine[termin_finden(curr_k, st.session_state.edit_termin)]
                     with st.form("edit_term_form"):
                         st.markdown(f"### ✏️ Termin bearbeiten: {curr_k.anrede} {curr_k.vorname} {curr_k.nachname}")
-                        c1, c2 = st.columns(2)
+                        c1, c2, c3 = st.columns(3)
                         new_d = c1.date_input("Datum", datetime.now()); new_t = c2.time_input("Uhrzeit", datetime.now().time())
+                        new_dauer = c3.number_input("Dauer (Min.)", DAUER_MIN, DAUER_MAX, alter_termin.dauer, step=5)
                         ct2, cm2 = st.columns(2)
                         u_t = ct2.text_input("Telefon", curr_k.telefon); u_m = cm2.text_input("Mobil", curr_k.mobil)
                         new_n = st.text_input("Notiz")
                         b1, b2 = st.columns(2)
                         if b1.form_submit_button("💾 Speichern"):
-                            curr_k.telefon, curr_k.mobil = u_t, u_m
-                            curr_k.termine[st.session_state.edit_term_idx] = f"{new_d.strftime('%d.%m.%Y')} um {new_t.strftime('%H:%M')} - {new_n}"
-                            speichern(db); st.success("✅ Gespeichert!"); time.sleep(3); st.rerun()
+                            neuer_termin = Termin(datetime.combine(new_d, new_t.replace(second=0, microsecond=0)), new_n, dauer=int(new_dauer))
+                            with db.sperre:
+                                # Unter der Sperre neu nachsehen: seit dem Anzeigen kann eine andere Session gespeichert haben
+                                curr_k = db.kunden.get(st.session_state.edit_id)
+                                pos = termin_finden(curr_k, st.session_state.edit_termin)
+                                konflikte = [] if pos is None else db.ueberschneidungen(neuer_termin.zeitpunkt, neuer_termin.ende, ausser=curr_k.termine[pos])
+                                if pos is not None and not konflikte:
+                                    neue_termine = list(curr_k.termine)
+                                    neue_termine[pos] = neuer_termin
+                                    db.bearbeiten(curr_k.kunden_id, telefon=u_t, mobil=u_m, termine=neue_termine)
+                                    speichern(db)
+                            if pos is None:
+                                st.error("⚠️ Der Termin wurde inzwischen geändert oder gelöscht, die Änderung wurde nicht gespeichert.")
+                            elif konflikte:
+                                ueberschneidungen_anzeigen(db, konflikte)
+                            else:
+                                st.session_state.edit_termin = neuer_termin.text; melden("Gespeichert!"); st.rerun()
                         if b2.form_submit_button("🗑️ Löschen"):
                             st.session_state.delete_confirm = True; st.rerun()
 
@@ -283,12 +2032,18 @@ def main():
                         st.warning("⚠️ Möchten Sie diesen Termin wirklich löschen?")
                         dc1, dc2 = st.columns(2)
                         if dc1.button("✅ Ja, Termin löschen"):
-                            curr_k.termine.pop(st.session_state.edit_term_idx); speichern(db); st.session_state.edit_id = None; st.session_state.delete_confirm = False; st.success("🗑️ Gelöscht!"); time.sleep(3); st.rerun()
+                            with db.sperre:
+                                curr_k = db.kunden.get(st.session_state.edit_id)
+                                pos = termin_finden(curr_k, st.session_state.edit_termin)
+                                if pos is not None:
+                                    db.bearbeiten(curr_k.kunden_id, termine=[t for i, t in enumerate(curr_k.termine) if i != pos]); speichern(db)
+                            st.session_state.edit_id = None; st.session_state.edit_termin = None; st.session_state.delete_confirm = False
+                            melden("Gelöscht!" if pos is not None else "Der Termin war bereits gelöscht.", "🗑️"); st.rerun()
                         if dc2.button("❌ Abbrechen"): st.session_state.delete_confirm = False; st.rerun()
 
             st.markdown("---")
-            if all_terms_list:
-                st.dataframe(pd.DataFrame(all_terms_list)[["ID", "Anrede", "Vorname", "Nachname", "Telefon", "Mobil", "Datum", "Uhrzeit", "Notiz"]], use_container_width=True, hide_index=True)
+            if not df_termine.empty:
+                tabelle_seitenweise(df_termine, ["ID", "Anrede", "Vorname", "Nachname", "Telefon", "Mobil", "Datum", "Uhrzeit", "Bis", "Notiz"], "termin_tabelle", {"Datum": "sort", "Uhrzeit": "sort"})
 
     # --- KUNDENSTAMM ---
     elif st.session_state.page == "Kundenstamm":
@@ -299,8 +2054,8 @@ def main():
             st.subheader("Neuen Kunden erfassen")
             with st.form("add_kunde_stamm_new"):
                 c1, c2 = st.columns(2)
-                anr = c1.selectbox("Anrede *", ["", "Herr", "Frau", "Divers"], index=0)
-                geschl = c2.selectbox("Geschlecht *", ["", "Männlich", "Weiblich", "Divers"], index=0)
+                anr = c1.selectbox("Anrede *", [""] + ANREDEN, index=0)
+                geschl = c2.selectbox("Geschlecht *", [""] + GESCHLECHTER, index=0)
                 vname = c1.text_input("Vorname *")
                 nname = c2.text_input("Nachname *")
                 alt = c1.number_input("Alter", 1, 120, 1)
@@ -311,25 +2066,15 @@ def main():
                 mob = c2.text_input("Mobil (nur Zahlen)")
                 
                 if st.form_submit_button("Kunden speichern"):
-                    errors = []
-                    if not anr: errors.append("Anrede fehlt.")
-                    if not geschl: errors.append("Geschlecht fehlt.")
-                    if not nname: errors.append("Nachname fehlt.")
-                    if not vname: errors.append("Vorname fehlt.")
-                    if not plz: errors.append("Postleitzahl fehlt.")
-                    if not ort: errors.append("Wohnort fehlt.")
-                    if not tel: errors.append("Telefon fehlt.")
-                    if plz and not plz.isdigit(): errors.append("PLZ darf nur Zahlen enthalten.")
-                    if tel and not tel.isdigit(): errors.append("Telefon darf nur Zahlen enthalten.")
-                    if mob and mob.strip() and not mob.isdigit(): errors.append("Mobil darf nur Zahlen enthalten.")
-                    if mail and mail.strip() and "@" not in mail: errors.append("Ungültige E-Mail Adresse (@ fehlt).")
+                    errors = kunde_pruefen(anr, geschl, vname, nname, alt, mail, plz, ort, tel, mob)
                     
                     if errors:
                         st.error("⚠️ Folgende Fehler sind aufgetreten:\n\n* " + "\n* ".join(errors))
                     else:
                         neuer_k = Kunde(anr, vname, nname, geschl, alt, mail, [ort], plz=plz, telefon=tel, mobil=mob)
-                        db.hinzufuegen(neuer_k); speichern(db)
-                        st.success(f"✅ Kunde erfolgreich unter der ID {neuer_k.kunden_id} angelegt!"); time.sleep(3); st.rerun()
+                        with db.sperre:
+                            db.hinzufuegen(neuer_k); speichern(db)
+                        melden(f"Kunde erfolgreich unter der ID {neuer_k.kunden_id} angelegt!"); st.rerun()
 
         with tab_k2:
             st.subheader("🔍 Kundensuche") 
@@ -337,14 +2082,10 @@ def main():
                 st.session_state.reset_stamm_search = False; st.session_state.stamm_suche = ""; st.rerun()
 
             suche = st.text_input("Suche", key="stamm_suche")
-            display_kunden = []
-            for k in db.kunden.values():
-                search_data = [k.vorname, k.nachname, k.kunden_id, ", ".join(k.wohnorte), k.plz, k.telefon, k.mobil, k.email]
-                if not suche or any(suche.lower() in str(v).lower() for v in search_data):
-                    display_kunden.append(k)
+            display_kunden = db.suchen(suche) if suche else []
             
             if suche and display_kunden:
-                auswahl = st.selectbox("Kunde zur Bearbeitung:", display_kunden, index=None, placeholder="Bitte wählen...", format_func=lambda x: f"{x.nachname}, {x.vorname} ({x.kunden_id})", key="stamm_select_persist")
+                auswahl = st.selectbox("Kunde zur Bearbeitung:", auswahl_begrenzen(display_kunden), index=None, placeholder="Bitte wählen...", format_func=lambda x: f"{x.nachname}, {x.vorname} ({x.kunden_id})", key="stamm_select_persist")
                 if auswahl:
                     c_k_sel1, c_k_sel2 = st.columns(2)
                     if c_k_sel1.button("👤 Bearbeiten"):
@@ -357,8 +2098,8 @@ def main():
                 with st.form("edit_kunde_form"):
                     st.markdown(f"### ✏️ {curr.nachname} bearbeiten")
                     c1, c2 = st.columns(2)
-                    u_anr = c1.selectbox("Anrede *", ["", "Herr", "Frau", "Divers"], index=["", "Herr", "Frau", "Divers"].index(curr.anrede) if curr.anrede in ["", "Herr", "Frau", "Divers"] else 0)
-                    u_geschl = c2.selectbox("Geschlecht *", ["", "Männlich", "Weiblich", "Divers"], index=["", "Männlich", "Weiblich", "Divers"].index(curr.geschlecht) if curr.geschlecht in ["", "Männlich", "Weiblich", "Divers"] else 0)
+                    u_anr = c1.selectbox("Anrede *", [""] + ANREDEN, index=([""] + ANREDEN).index(curr.anrede) if curr.anrede in ANREDEN else 0)
+                    u_geschl = c2.selectbox("Geschlecht *", [""] + GESCHLECHTER, index=([""] + GESCHLECHTER).index(curr.geschlecht) if curr.geschlecht in GESCHLECHTER else 0)
                     u_vname = c1.text_input("Vorname *", curr.vorname); u_nname = c2.text_input("Nachname *", curr.nachname)
                     u_alt = c1.number_input("Alter", 1, 120, int(curr.alter) if str(curr.alter).isdigit() else 1)
                     u_mail = c2.text_input("E-Mail", curr.email)
@@ -366,24 +2107,15 @@ def main():
                     u_tel = c1.text_input("Telefon * (nur Zahlen)", curr.telefon); u_mob = c2.text_input("Mobil (nur Zahlen)", curr.mobil)
                     b1, b2 = st.columns(2)
                     if b1.form_submit_button("💾 Änderungen speichern"):
-                        e_edit = []
-                        if not u_anr: e_edit.append("Anrede fehlt.")
-                        if not u_geschl: e_edit.append("Geschlecht fehlt.")
-                        if not u_nname: e_edit.append("Nachname fehlt.")
-                        if not u_vname: e_edit.append("Vorname fehlt.")
-                        if not u_plz: e_edit.append("Postleitzahl fehlt.")
-                        if not u_ort: e_edit.append("Wohnort fehlt.")
-                        if not u_tel: e_edit.append("Telefon fehlt.")
-                        if u_plz and not u_plz.isdigit(): e_edit.append("PLZ darf nur Zahlen enthalten.")
-                        if u_tel and not u_tel.isdigit(): e_edit.append("Telefon darf nur Zahlen enthalten.")
-                        if u_mob and u_mob.strip() and not u_mob.isdigit(): e_edit.append("Mobil darf nur Zahlen enthalten.")
-                        if u_mail and u_mail.strip() and "@" not in u_mail: e_edit.append("Ungültige E-Mail Adresse (@ fehlt).")
+                        e_edit = kunde_pruefen(u_anr, u_geschl, u_vname, u_nname, u_alt, u_mail, u_plz, u_ort, u_tel, u_mob)
                         
                         if e_edit:
                             st.error("⚠️ Änderungen nicht gespeichert:\n\n* " + "\n* ".join(e_edit))
                         else:
-                            db.bearbeiten(curr.kunden_id, anrede=u_anr, vorname=u_vname, nachname=u_nname, geschlecht=u_geschl, alter=u_alt, email=u_mail, wohnorte=[u_ort], plz=u_plz, telefon=u_tel, mobil=u_mob)
-                            speichern(db); st.success("✅ Gespeichert!"); time.sleep(3); st.rerun()
+                            with db.sperre:
+                                db.bearbeiten(curr.kunden_id, anrede=u_anr, vorname=u_vname, nachname=u_nname, geschlecht=u_geschl, alter=u_alt, email=u_mail, wohnorte=[u_ort], plz=u_plz, telefon=u_tel, mobil=u_mob)
+                                speichern(db)
+                            melden("Gespeichert!"); st.rerun()
                     if b2.form_submit_button("🗑️ Löschen"):
                         st.session_state.delete_confirm = True; st.rerun()
                 
@@ -391,13 +2123,19 @@ def main():
                     st.warning(f"⚠️ Möchten Sie den Kunden {curr.nachname} wirklich löschen?")
                     dk1, dk2 = st.columns(2)
                     if dk1.button("✅ Ja, Kunde löschen"):
-                        db.loeschen(curr.kunden_id); speichern(db); st.session_state.edit_id = None; st.session_state.delete_confirm = False; st.success("🗑️ Gelöscht!"); time.sleep(3); st.rerun()
+                        with db.sperre:
+                            db.loeschen(curr.kunden_id); speichern(db)
+                        st.session_state.edit_id = None; st.session_state.delete_confirm = False; melden("Gelöscht!", "🗑️"); st.rerun()
                     if dk2.button("❌ Abbrechen"): st.session_state.delete_confirm = False; st.rerun()
 
             st.markdown("---")
-            if display_kunden:
-                df_stamm = pd.DataFrame([k.to_table_row() for k in display_kunden])
-                st.dataframe(df_stamm[["ID", "Anrede", "Vorname", "Nachname", "Geschlecht", "Alter", "Mobil", "Telefon", "E-Mail", "Termine vorhanden?"]], use_container_width=True, hide_index=True)
+            df_stamm = db.kunden_tabelle([k.kunden_id for k in display_kunden] if suche else None)
+            if not df_stamm.empty:
+                tabelle_seitenweise(df_stamm, ["ID", "Anrede", "Vorname", "Nachname", "Geschlecht", "Alter", "Mobil", "Telefon", "E-Mail", "Termine vorhanden?"], "stamm_tabelle")
 
 if __name__ == "__main__":
-    main()
+    # 'streamlit run KVS.py' startet die App, 'python KVS.py import ...' den Massenimport
+    if st.runtime.exists():
+        main()
+    else:
+        kommandozeile()
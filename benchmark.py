@@ -0,0 +1,194 @@
+"""Benchmark für die Datenschicht von KVS.py.
+
+Erzeugt synthetische Kundendaten im Schema von kunden.json (1k bis 1M Kunden) und misst die
+heißen Pfade: laden, speichern, die Suchmodi der Seiten, nächster Termin, Terminbereiche,
+freie Slots, Tabellenaufbau und das Lesen von Terminen. Ausgabe als JSON mit Perzentilen (ms)
+und Speicherspitze (tracemalloc) je Messung, damit Läufe vergleichbar bleiben.
+
+    python benchmark.py --kunden 1000 10000 100000 --ausgabe ergebnis.json
+    python benchmark.py --datei kunden.json          # vorhandene Datei messen
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import KVS
+
+VORNAMEN = ["Anna", "Ben", "Clara", "David", "Emma", "Felix", "Greta", "Hannes", "Ida", "Jonas", "Klara", "Lukas",
+            "Mia", "Noah", "Olivia", "Paul", "Quirin", "Rosa", "Simon", "Tilda", "Ulrich", "Vera", "Werner", "Zoe"]
+NACHNAMEN = ["Müller", "Schmidt", "Schneider", "Fischer", "Weber", "Meyer", "Wagner", "Becker", "Schulz", "Hoffmann",
+             "Koch", "Richter", "Klein", "Wolf", "Neumann", "Schwarz", "Zimmermann", "Braun", "Krüger", "Hartmann"]
+ORTE = ["Berlin", "Hamburg", "München", "Köln", "Frankfurt", "Stuttgart", "Düsseldorf", "Leipzig", "Dortmund", "Essen",
+        "Bremen", "Dresden", "Hannover", "Nürnberg", "Duisburg", "Bochum", "Wuppertal", "Bielefeld", "Bonn", "Münster"]
+NOTIZEN = ["Beratung", "Erstgespräch", "Nachkontrolle", "Vertrag", "Rückruf", ""]
+ANREDE_GESCHLECHT = [("Herr", "Männlich"), ("Frau", "Weiblich"), ("Divers", "Divers")]
+
+
+def kunde_erzeugen(rng, nr, basis):
+    anrede, geschlecht = rng.choice(ANREDE_GESCHLECHT)
+    vorname, nachname = rng.choice(VORNAMEN), rng.choice(NACHNAMEN)
+    termine = []
+    for _ in range(rng.choice((0, 1, 1, 2, 2, 3, 5))):
+        start = basis + timedelta(minutes=15 * rng.randrange(-2 * 365 * 96, 365 * 96))
+        dauer = rng.choice((KVS.TERMIN_DAUER, KVS.TERMIN_DAUER, 15, 60))
+        termine.append(KVS.Termin(start, rng.choice(NOTIZEN), dauer=dauer).text)
+    return {
+        "ID": f"{nr:08x}", "Anrede": anrede, "Vorname": vorname, "Nachname": nachname, "Geschlecht": geschlecht,
+        "Alter": rng.randrange(1, 100), "E-Mail": f"{vorname}.{nachname}{nr}@example.com".lower(),
+        "PLZ": f"{rng.randrange(1000, 99999):05d}", "Telefon": f"0{rng.randrange(10**8, 10**9)}",
+        "Mobil": f"01{rng.randrange(10**8, 10**9)}" if rng.random() < 0.7 else "",
+        "Wohnorte": ", ".join(rng.sample(ORTE, rng.choice((1, 1, 1, 2)))), "Termine": " | ".join(termine), "Version": 0,
+    }
+
+
+def daten_erzeugen(pfad, anzahl, seed=1, basis=None):
+    """Schreibt 'anzahl' Kunden als Snapshot im Format von kunden.json, ohne sie alle im Speicher zu halten."""
+    rng = random.Random(seed)
+    basis = basis or datetime(2026, 1, 5, 8, 0)
+    with open(pfad, "w", encoding="utf-8") as f:
+        f.write("{")
+        for nr in range(anzahl):
+            kunde = kunde_erzeugen(rng, nr, basis)
+            f.write(("," if nr else "") + "\n    " + json.dumps(kunde["ID"]) + ": " + json.dumps(kunde, ensure_ascii=False))
+        f.write("\n}")
+
+
+def auswerten(zeiten):
+    zeiten = sorted(zeiten)
+    def perzentil(p):
+        return zeiten[min(len(zeiten) - 1, round(p / 100 * (len(zeiten) - 1)))] * 1e3
+    return {"n": len(zeiten), "mittel_ms": statistics.fmean(zeiten) * 1e3, "p50_ms": perzentil(50),
+            "p90_ms": perzentil(90), "p99_ms": perzentil(99), "max_ms": zeiten[-1] * 1e3}
+
+
+def messen(name, funktion, argumente, speicher=True):
+    """Ruft funktion(*a) für jedes Element von 'argumente' auf; danach ein Lauf unter tracemalloc für die Speicherspitze."""
+    zeiten = []
+    for a in argumente:
+        start = time.perf_counter()
+        funktion(*a)
+        zeiten.append(time.perf_counter() - start)
+    ergebnis = {"messung": name, **auswerten(zeiten)}
+    if speicher:
+        tracemalloc.start()
+        funktion(*argumente[0])
+        ergebnis["spitze_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    print(f"  {name:<28} p50 {ergebnis['p50_ms']:10.3f} ms  p99 {ergebnis['p99_ms']:10.3f} ms", file=sys.stderr)
+    return ergebnis
+
+
+def suchbegriffe(rng, db, anzahl):
+    """Realistische Eingaben: Namensteile verschiedener Länge, Ziffernfolgen, IDs und Fehlgriffe."""
+    kunden = rng.sample(list(db.kunden.values()), min(anzahl, len(db.kunden)))
+    begriffe = []
+    for i, k in enumerate(kunden):
+        art = i % 6
+        if art == 0: begriffe.append(k.nachname[:2])
+        elif art == 1: begriffe.append(k.nachname.lower())
+        elif art == 2: begriffe.append(k.vorname[1:4])
+        elif art == 3: begriffe.append(k.telefon[-4:])
+        elif art == 4: begriffe.append(k.kunden_id)
+        else: begriffe.append("xyzq")
+    return begriffe
+
+
+def lauf(pfad, wiederholungen, seed):
+    rng = random.Random(seed)
+    ergebnisse = []
+    ergebnisse.append(messen("laden", lambda: KVS.laden(pfad), [()] * max(1, wiederholungen // 10)))
+    db = KVS.laden(pfad)
+    kunden = len(db.kunden)
+    termine = sum(len(k.termine) for k in db.kunden.values())
+    print(f"{pfad}: {kunden} Kunden, {termine} Termine", file=sys.stderr)
+
+    texte = [t.text for k in rng.sample(list(db.kunden.values()), min(2000, kunden)) for t in k.termine]
+    ergebnisse.append(messen("termine_lesen (je 1000)", lambda: [KVS.Termin.from_text(t) for t in texte[:1000]], [()] * wiederholungen))
+
+    begriffe = suchbegriffe(rng, db, wiederholungen * 6)
+    for name, felder in (("suchen_kundenstamm", KVS.SUCHFELDER), ("suchen_terminsuche", KVS.TERMIN_SUCHFELDER),
+                         ("suchen_buchung", KVS.BUCHUNG_SUCHFELDER)):
+        ergebnisse.append(messen(name, lambda b, f=felder: db.suchen(b, f), [(b,) for b in begriffe]))
+
+    basis = datetime(2026, 1, 5, 8, 0)
+    zeitpunkte = [(basis + timedelta(hours=rng.randrange(-24 * 365, 24 * 365)),) for _ in range(wiederholungen * 10)]
+    ergebnisse.append(messen("naechster_termin", db.naechster_termin, zeitpunkte))
+    ergebnisse.append(messen("termine_7_tage", lambda ab: db.termine_zwischen(ab, ab + timedelta(days=7)), zeitpunkte))
+    ergebnisse.append(messen("ueberschneidungen", lambda ab: db.ueberschneidungen(ab, ab + timedelta(minutes=30)), zeitpunkte))
+    ergebnisse.append(messen("freie_slots (5)", lambda ab: db.freie_slots(ab, ab + timedelta(days=30)), zeitpunkte[:wiederholungen]))
+    ergebnisse.append(messen("kennzahlen", db.kennzahlen_uebersicht, zeitpunkte))
+
+    def tabellen_kalt():
+        db.tabellen.zuruecksetzen(); db.kunden_tabelle(); db.termin_tabelle()
+    ergebnisse.append(messen("tabellen_aufbau_kalt", tabellen_kalt, [()] * max(1, wiederholungen // 10)))
+    ids = list(db.kunden)
+
+    def tabellen_nach_aenderung():
+        k_id = rng.choice(ids)
+        db.bearbeiten(k_id, mobil=db.kunden[k_id].mobil)
+        db.kunden_tabelle(); db.termin_tabelle()
+    ergebnisse.append(messen("tabellen_nach_aenderung", tabellen_nach_aenderung, [()] * wiederholungen))
+    KVS.speichern(db)  # die Änderungen oben nicht der ersten Einzelspeicherung anrechnen
+
+    def aendern_und_speichern():
+        k_id = rng.choice(ids)
+        with db.sperre:
+            db.bearbeiten(k_id, telefon=f"0{rng.randrange(10**8, 10**9)}")
+            KVS.speichern(db)
+    ergebnisse.append(messen("speichern_einzeln", aendern_und_speichern, [()] * wiederholungen))
+    if getattr(db.speicher, "_kompaktierung", None):
+        db.speicher._kompaktierung.join()  # Hintergrund-Kompaktierung nicht in die nächste Messung laufen lassen
+    ergebnisse.append(messen("speichern_komplett", lambda: db.speicher.neu_schreiben(db), [()] * max(1, wiederholungen // 10)))
+    return {"datei": pfad, "kunden": kunden, "termine": termine, "messungen": ergebnisse}
+
+
+def main(argumente=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--kunden", type=int, nargs="+", default=[1000, 10_000], help="Größen der synthetischen Datensätze")
+    parser.add_argument("--datei", help="vorhandene Datendatei messen statt synthetische Daten zu erzeugen")
+    parser.add_argument("--wiederholungen", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ausgabe", help="JSON-Ergebnis in diese Datei statt auf stdout")
+    args = parser.parse_args(argumente)
+
+    ergebnis = {"zeit": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                "plattform": platform.platform(), "seed": args.seed, "wiederholungen": args.wiederholungen, "laeufe": []}
+    verzeichnis = tempfile.mkdtemp(prefix="kvs-benchmark-")
+    try:
+        if args.datei:
+            # Kopie, damit speichern() die Originaldatei nicht verändert. Dazu gehören die Begleitdateien:
+            # das Journal bzw. bei SQLite das WAL mit noch nicht zurückgeschriebenen Commits
+            pfad = os.path.join(verzeichnis, os.path.basename(args.datei))
+            for endung in ("", ".journal", "-wal", "-shm"):
+                if endung == "" or os.path.exists(args.datei + endung):
+                    shutil.copy(args.datei + endung, pfad + endung)
+            ergebnis["laeufe"].append(lauf(pfad, args.wiederholungen, args.seed))
+        for anzahl in ([] if args.datei else args.kunden):
+            pfad = os.path.join(verzeichnis, f"kunden_{anzahl}.json")
+            start = time.perf_counter()
+            daten_erzeugen(pfad, anzahl, args.seed)
+            print(f"{anzahl} Kunden erzeugt in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+            ergebnis["laeufe"].append(lauf(pfad, args.wiederholungen, args.seed))
+    finally:
+        shutil.rmtree(verzeichnis, ignore_errors=True)
+
+    text = json.dumps(ergebnis, indent=2, ensure_ascii=False)
+    if args.ausgabe:
+        with open(args.ausgabe, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
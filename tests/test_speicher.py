@@ -0,0 +1,264 @@
+"""Regressionstests für den Dreiwege-Merge und mehrere Speicher-Instanzen auf derselben Datei.
+
+    python -m pytest tests
+"""
+import os
+import random
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import KVS
+
+
+def kunde(k_id, **felder):
+    daten = {"ID": k_id, "Anrede": "Herr", "Vorname": "Max", "Nachname": "Muster", "Geschlecht": "Männlich", "Alter": 40,
+             "E-Mail": "max@example.com", "PLZ": "12345", "Telefon": "0301234", "Mobil": "", "Wohnorte": "Berlin",
+             "Termine": "", "Version": 0}
+    daten.update(felder)
+    return daten
+
+
+def termine(db, k_id):
+    return sorted(t.text for t in db.kunden[k_id].termine)
+
+
+# --- zusammenfuehren ---
+
+def test_merge_uebernimmt_felder_beider_seiten():
+    basis = kunde("k1")
+    ergebnis = KVS.zusammenfuehren(basis, {**basis, "Vorname": "Moritz"}, {**basis, "PLZ": "99999"})
+    assert (ergebnis["Vorname"], ergebnis["PLZ"]) == ("Moritz", "99999")
+
+
+def test_merge_gleiches_feld_unsere_gewinnt():
+    basis = kunde("k1")
+    assert KVS.zusammenfuehren(basis, {**basis, "Vorname": "Unser"}, {**basis, "Vorname": "Ihr"})["Vorname"] == "Unser"
+
+
+def test_merge_termine_als_menge():
+    a, b, c = "01.02.2027 um 10:00 - a", "02.02.2027 um 10:00 - b", "03.02.2027 um 10:00 - c"
+    basis = kunde("k1", Termine=a)
+    ergebnis = KVS.zusammenfuehren(basis, {**basis, "Termine": f"{a} | {b}"}, {**basis, "Termine": c})
+    # b kam bei uns dazu, c bei ihnen, a haben sie gelöscht
+    assert sorted(ergebnis["Termine"].split(" | ")) == [b, c]
+
+
+def test_merge_aenderung_schlaegt_loeschung():
+    basis = kunde("k1")
+    geaendert = {**basis, "Nachname": "Neu"}
+    assert KVS.zusammenfuehren(basis, None, geaendert) == geaendert
+    assert KVS.zusammenfuehren(basis, geaendert, None) == geaendert
+    assert KVS.zusammenfuehren(basis, None, None) is None
+
+
+# --- zwei Instanzen auf derselben Datei ---
+
+@pytest.fixture(params=[".json", ".db"])
+def datei(request, tmp_path):
+    pfad = str(tmp_path / f"kunden{request.param}")
+    db = KVS.laden(pfad)
+    db.hinzufuegen_viele([KVS.Kunde.from_dict(kunde(f"k{i}")) for i in range(5)])
+    KVS.speichern(db)
+    return pfad
+
+
+def test_gleichzeitige_aenderungen_werden_vereinigt(datei):
+    a, b = KVS.laden(datei), KVS.laden(datei)
+    a.bearbeiten("k1", vorname="Anna"); KVS.speichern(a)
+    b.bearbeiten("k1", plz="99999", termine=["01.02.2027 um 10:00 - von b"]); KVS.speichern(b)
+    a.bearbeiten("k1", termine=[t.text for t in a.kunden["k1"].termine] + ["02.02.2027 um 10:00 - von a"]); KVS.speichern(a)
+    c = KVS.laden(datei)
+    assert (c.kunden["k1"].vorname, c.kunden["k1"].plz) == ("Anna", "99999")
+    assert termine(c, "k1") == ["01.02.2027 um 10:00 - von b", "02.02.2027 um 10:00 - von a"]
+    assert c.kunden["k1"].version == 4  # angelegt + drei Schreibvorgänge
+
+
+def test_aenderung_schlaegt_fremde_loeschung(datei):
+    a, b = KVS.laden(datei), KVS.laden(datei)
+    a.loeschen("k2"); KVS.speichern(a)
+    b.bearbeiten("k2", nachname="Bleibt"); KVS.speichern(b)
+    assert KVS.laden(datei).kunden["k2"].nachname == "Bleibt"
+
+
+def test_aktualisieren_zieht_fremde_aenderungen_nach(datei):
+    a, b = KVS.laden(datei), KVS.laden(datei)
+    a.bearbeiten("k3", vorname="Fremd", termine=["03.02.2027 um 09:00 - neu"]); a.loeschen("k4")
+    a.hinzufuegen(KVS.Kunde.from_dict(kunde("k9"))); KVS.speichern(a)
+    assert b.speicher.extern_geaendert()
+    b.speicher.aktualisieren(b)
+    assert not b.speicher.extern_geaendert()
+    assert b.kunden["k3"].vorname == "Fremd" and "k4" not in b.kunden and "k9" in b.kunden
+    assert [k.kunden_id for k in b.suchen("fremd")] == ["k3"]
+    assert [t.kunden_id for t in b.termine_zwischen(KVS.datetime(2027, 2, 3), KVS.datetime(2027, 2, 4))] == ["k3"]
+
+
+def test_sqlite_nachziehen_ohne_neu_laden(tmp_path, monkeypatch):
+    pfad = str(tmp_path / "kunden.db")
+    a = KVS.laden(pfad)
+    a.hinzufuegen(KVS.Kunde.from_dict(kunde("k1"))); KVS.speichern(a)
+    b = KVS.laden(pfad)
+    monkeypatch.setattr(b, "neu_laden", lambda: pytest.fail("komplettes Neuladen statt Nachziehen"))
+    a.bearbeiten("k1", vorname="Inkrementell"); KVS.speichern(a)
+    b.speicher.aktualisieren(b)
+    assert b.kunden["k1"].vorname == "Inkrementell"
+
+
+def test_sqlite_gekuerztes_protokoll_laedt_neu(tmp_path, monkeypatch):
+    pfad = str(tmp_path / "kunden.db")
+    monkeypatch.setattr(KVS.SqliteSpeicher, "AENDERUNGEN_BEHALTEN", 1)
+    a = KVS.laden(pfad)
+    a.hinzufuegen(KVS.Kunde.from_dict(kunde("k1"))); KVS.speichern(a)
+    b = KVS.laden(pfad)
+    for name in ("Eins", "Zwei", "Drei"):
+        a.bearbeiten("k1", vorname=name); KVS.speichern(a)
+    b.speicher.aktualisieren(b)
+    assert b.kunden["k1"].vorname == "Drei"
+
+
+# --- Journal: Generationen und abgebrochene Zeilen ---
+
+def test_journal_fremde_kompaktierung(tmp_path):
+    pfad = str(tmp_path / "kunden.json")
+    a = KVS.laden(pfad)
+    a.hinzufuegen_viele([KVS.Kunde.from_dict(kunde(f"k{i}")) for i in range(3)]); KVS.speichern(a)
+    b = KVS.laden(pfad)
+    a.bearbeiten("k0", vorname="VorKompaktierung"); KVS.speichern(a)
+    generation = a.speicher.generation
+    a.speicher.kompaktieren(a, hintergrund=False)
+    assert a.speicher.generation != generation
+    # b kennt die neue Generation noch nicht und muss trotzdem korrekt anhängen
+    b.bearbeiten("k1", vorname="NachKompaktierung"); KVS.speichern(b)
+    assert b.speicher.generation == a.speicher.generation
+    c = KVS.laden(pfad)
+    assert (c.kunden["k0"].vorname, c.kunden["k1"].vorname) == ("VorKompaktierung", "NachKompaktierung")
+
+
+def test_journal_abgebrochene_zeile_wird_abgeschnitten(tmp_path):
+    pfad = str(tmp_path / "kunden.json")
+    a = KVS.laden(pfad)
+    a.hinzufuegen(KVS.Kunde.from_dict(kunde("k1"))); KVS.speichern(a)
+    groesse = os.path.getsize(pfad + ".journal")
+    with open(pfad + ".journal", "ab") as f:
+        f.write(b'{"op": "upsert", "ID": "k1", "daten": {"Vorn')  # Absturz mitten im Schreiben
+    b = KVS.laden(pfad)
+    assert b.kunden["k1"].vorname == "Max"
+    assert os.path.getsize(pfad + ".journal") == groesse
+    b.bearbeiten("k1", vorname="Danach"); KVS.speichern(b)
+    assert KVS.laden(pfad).kunden["k1"].vorname == "Danach"
+
+
+def test_beschaedigter_snapshot_wird_nicht_ueberschrieben(tmp_path):
+    pfad = str(tmp_path / "kunden.json")
+    a = KVS.laden(pfad)
+    a.hinzufuegen_viele([KVS.Kunde.from_dict(kunde(f"k{i}")) for i in range(3)]); KVS.speichern(a)
+    a.speicher.kompaktieren(a, hintergrund=False)
+    with open(pfad, encoding="utf-8") as f:
+        text = f.read()
+    with open(pfad, "w", encoding="utf-8") as f:
+        f.write(text.replace('"k1": {', '"k1": {"ID" "kaputt",', 1))
+    b = KVS.laden(pfad)
+    assert b.speicher.ladefehler and "k2" not in b.kunden
+    b.bearbeiten("k0", vorname="Journal"); KVS.speichern(b)
+    b.speicher.kompaktieren(b, hintergrund=False)
+    with pytest.raises(RuntimeError):
+        b.speicher.neu_schreiben(b)
+    with open(pfad, encoding="utf-8") as f:
+        assert '"ID" "kaputt"' in f.read()
+
+
+def test_leerer_snapshot_ist_leere_datenbank(tmp_path):
+    pfad = tmp_path / "kunden.json"
+    pfad.write_bytes(b"")  # Rest eines Absturzes beim Schreiben
+    db = KVS.laden(str(pfad))
+    assert not db.kunden and db.speicher.ladefehler is None
+    db.hinzufuegen(KVS.Kunde.from_dict(kunde("k1"))); KVS.speichern(db)
+    db.speicher.kompaktieren(db, hintergrund=False)
+    assert list(KVS.laden(str(pfad)).kunden) == ["k1"] and os.path.getsize(pfad) > 0
+
+
+def test_kennzahl_7_tage_wie_liste_kommender_termine():
+    db = KVS.Datenbank()
+    zeiten = ["01.02.2027 um 09:00", "01.02.2027 um 15:00", "05.02.2027 um 10:00", "08.02.2027 um 11:00", "08.02.2027 um 13:00"]
+    db.hinzufuegen(KVS.Kunde.from_dict(kunde("k1", Termine=" | ".join(f"{z} - t" for z in zeiten))))
+    jetzt = KVS.datetime(2027, 2, 1, 12, 0)
+    liste = db.termine_zwischen(jetzt, jetzt + KVS.timedelta(days=7))
+    assert db.kennzahlen_uebersicht(jetzt)["termine_7_tage"] == len(liste) == 3
+
+
+# --- Suchindex ---
+
+@pytest.mark.parametrize("block", [1, 20_000])
+def test_suchindex_aufbauen_wie_einzeln(monkeypatch, block):
+    monkeypatch.setattr(KVS.SuchIndex, "BLOCK", block)
+    zufall = random.Random(block)
+    kunden = [KVS.Kunde.from_dict(kunde("ab", Vorname="x", Nachname="y", **{"E-Mail": "", "PLZ": "", "Telefon": "", "Wohnorte": "z"}))]
+    kunden += [KVS.Kunde.from_dict(kunde(f"k{i}", Vorname="".join(zufall.choice("aäbßcé") for _ in range(zufall.randint(0, 6))),
+                                         Nachname=zufall.choice(["Müller", "Ölçer", "Li", ""]))) for i in range(50)]
+    gebaut, einzeln = KVS.SuchIndex(), KVS.SuchIndex()
+    gebaut.aufbauen(kunden)
+    for k in kunden:
+        einzeln.hinzufuegen(k)
+    assert gebaut._listen == einzeln._listen
+    for begriff in ["ab", "mül", "ller", "äb", "ßc", "k1", "xyz"]:
+        assert gebaut.suchen(begriff) == einzeln.suchen(begriff)
+
+
+def test_laden_mit_lauter_kurzen_feldern(tmp_path):
+    pfad = str(tmp_path / "kunden.json")
+    db = KVS.laden(pfad)
+    db.hinzufuegen(KVS.Kunde.from_dict({"ID": "ab", "Vorname": "x"})); KVS.speichern(db)
+    assert list(KVS.laden(pfad).kunden) == ["ab"]
+
+
+# --- Import ---
+
+def test_import_ohne_spalten_behaelt_bestehende_werte(tmp_path):
+    db = KVS.laden(str(tmp_path / "kunden.json"))
+    db.hinzufuegen(KVS.Kunde.from_dict(kunde("k1", Mobil="0170123", Termine="01.02.2027 um 10:00 - a | 02.02.2027 um 10:00 - b")))
+    KVS.speichern(db)
+    crm = tmp_path / "crm.csv"
+    crm.write_text("ID,Anrede,Vorname,Nachname,Geschlecht,Alter,E-Mail,PLZ,Telefon,Wohnorte\n"
+                   "k1,Frau,Erika,Neu,Weiblich,41,erika@example.com,54321,0409876,Hamburg\n"
+                   "k2,Herr,Otto,Neu,Männlich,30,otto@example.com,11111,0301111,Berlin\n", encoding="utf-8")
+    bericht = KVS.importieren(db, str(crm))
+    assert bericht.importiert == 2 and not bericht.abgelehnt
+    assert (db.kunden["k1"].nachname, db.kunden["k1"].mobil) == ("Neu", "0170123")
+    assert termine(db, "k1") == ["01.02.2027 um 10:00 - a", "02.02.2027 um 10:00 - b"]
+    assert db.kunden["k2"].termine == [] and db.kunden["k2"].mobil == ""
+    # Steht die Spalte in der Datei, gilt auch ein leerer Wert
+    mit_terminen = tmp_path / "mit_terminen.csv"
+    mit_terminen.write_text(crm.read_text(encoding="utf-8").splitlines()[0] + ",Termine\n"
+                            "k1,Frau,Erika,Neu,Weiblich,41,erika@example.com,54321,0409876,Hamburg,\n", encoding="utf-8")
+    KVS.importieren(db, str(mit_terminen))
+    assert db.kunden["k1"].termine == [] and db.kunden["k1"].mobil == "0170123"
+
+
+# --- Tabellen-Cache ---
+
+@pytest.mark.parametrize("schritte", [1, 5, 40, 300])
+def test_gepatchte_tabellen_wie_neu_gebaut(schritte):
+    zufall = random.Random(schritte)
+    db = KVS.Datenbank()
+    def termine_zufaellig():
+        return [f"{zufall.randint(1, 5):02d}.03.2027 um {zufall.choice(['09:00', '10:00', '10:00-11:30'])} - n" for _ in range(zufall.randint(0, 3))]
+    db.hinzufuegen_viele([KVS.Kunde.from_dict(kunde(f"k{i}", Termine=" | ".join(termine_zufaellig()))) for i in range(300)])
+    naechste = 300
+    for runde in range(8):
+        db.kunden_tabelle(); db.termin_tabelle()
+        for _ in range(schritte):
+            art, ids = zufall.random(), list(db.kunden)
+            if art < 0.3 or not ids:
+                db.hinzufuegen(KVS.Kunde.from_dict(kunde(f"k{naechste}", Termine=" | ".join(termine_zufaellig())))); naechste += 1
+            elif art < 0.7:
+                db.bearbeiten(zufall.choice(ids), vorname=f"V{runde}", termine=termine_zufaellig())
+            else:
+                db.loeschen(zufall.choice(ids))
+    gepatcht = (db.kunden_tabelle(), db.termin_tabelle())
+    frisch = KVS.TabellenAnsicht(db.kunden)
+    pd.testing.assert_frame_equal(gepatcht[0].sort_index(), frisch.kunden().sort_index())
+    nach_zeit = lambda df: df.sort_values(["sort", "ID", "idx"], ignore_index=True)
+    pd.testing.assert_frame_equal(nach_zeit(gepatcht[1]), nach_zeit(frisch.termine()))
+    assert gepatcht[1]["sort"].is_monotonic_increasing